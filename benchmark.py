@@ -0,0 +1,965 @@
+import inspect
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest.mock import patch
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils import column_index_from_string
+
+from main import trimming_machines, vacuum_machines  # importing main does no I/O (tests/test_import.py)
+from plan_workbook import read_sheet_blocks
+
+# Same layout as the "PVT - Planned Start Date" sheet that main.py reads
+sheet_name_pvt = "PVT - Planned Start Date"
+header_row = 11
+plan_blocks = {
+    "vacuum": ("M:S", header_row),
+    "trimming": ("X:AD", header_row),
+    "stores": ("B:H", header_row),
+    "stores_goods_in": ("CK:CQ", header_row),
+}
+plan_headers = {
+    "vacuum": ["Production Resources.ResourceDescription", "StartDate", "WorksOrderNumber",
+               "Sum of TotalHours", "Part Number", "Parts Qty", "WO Status"],
+    "trimming": ["Production Resources.ResourceDescription", "StartDate", "WorksOrderNumber",
+                 "Sum of TotalHours", "Part Number", "Parts Qty", "WO Status"],
+    "stores": ["StartDate", "WorksOrderNumber", "Part Number", "Sum of TotalHours",
+               "Parts Qty", "WO Status", "Printing Status"],
+    "stores_goods_in": ["FinishDate", "WorksOrderNumber", "Part Number", "Sum of TotalHours",
+                        "Parts Qty", "WO Status", "Printing Status"],
+}
+
+
+def _block_row(block, i, start):
+    date = start + timedelta(days=i % 60)
+    wo = f"WO{i:07d}"
+    part = f"P-{i % 977:05d}"
+    hours = round((i % 37) * 0.25, 2)
+    qty = (i % 50) + 1
+    status = ["Released", "In Progress", "Allocated"][i % 3]
+    if block == "vacuum":
+        return [vacuum_machines[i % len(vacuum_machines)], date, wo, hours, part, qty, status]
+    if block == "trimming":
+        return [trimming_machines[i % len(trimming_machines)], date, wo, hours, part, qty, status]
+    printing = "Printed" if i % 2 else "Not Printed"
+    return [date, wo, part, hours, qty, status, printing]
+
+
+def make_plan_workbook(rows):
+    """Build a synthetic "Plan vs Actual" workbook with `rows` work orders per block"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name_pvt)
+    starts = {name: column_index_from_string(usecols.split(":")[0]) - 1
+              for name, (usecols, _) in plan_blocks.items()}
+    width = max(starts.values()) + 7
+    start = datetime(2025, 1, 1)
+
+    for _ in range(header_row):
+        ws.append([])
+    line = [None] * width
+    for name, headers in plan_headers.items():
+        line[starts[name]:starts[name] + 7] = headers
+    ws.append(line)
+    for i in range(rows):
+        line = [None] * width
+        for name in plan_blocks:
+            line[starts[name]:starts[name] + 7] = _block_row(name, i, start)
+        ws.append(line)
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _measure(func):
+    # Timed and memory-traced in separate runs: tracemalloc slows the
+    # openpyxl parser down by an order of magnitude
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_plan_parse(sizes=(10_000, 100_000)):
+    """Four pd.read_excel passes (old path) vs one streamed pass (read_sheet_blocks)"""
+    for rows in sizes:
+        content = make_plan_workbook(rows)
+
+        def four_passes():
+            stream = BytesIO(content)
+            frames = {}
+            for name, (usecols, header) in plan_blocks.items():
+                stream.seek(0)
+                frames[name] = pd.read_excel(stream, sheet_name=sheet_name_pvt, header=header,
+                                             usecols=usecols, engine="openpyxl")
+            return frames
+
+        def single_pass():
+            return read_sheet_blocks(BytesIO(content), sheet_name_pvt, plan_blocks)
+
+        old, old_time, old_peak = _measure(four_passes)
+        new, new_time, new_peak = _measure(single_pass)
+        for name in plan_blocks:
+            # pandas de-duplicates headers across the whole sheet ("StartDate.1");
+            # clean_and_prepare_df strips that suffix anyway
+            old[name].columns = old[name].columns.str.replace(r'\.\d+$', '', regex=True)
+            pd.testing.assert_frame_equal(old[name], new[name])
+
+        print(f"plan parse, {rows} rows ({len(content) / 1e6:.1f} MB):")
+        print(f"  read_excel x4:     {old_time:8.2f}s  peak {old_peak / 1e6:8.1f} MB")
+        print(f"  read_sheet_blocks: {new_time:8.2f}s  peak {new_peak / 1e6:8.1f} MB"
+              f"  ({old_time / new_time:.1f}x faster)")
+
+
+def bench_dashboard_cache(requests_per_route=200):
+    """
+    Requests/sec per dashboard route with the snapshot cache off vs on.
+    Runs against the database in the production-data-db environment variable (already loaded).
+    """
+    import main
+
+    client = main.app.test_client()
+    routes = ["/", "/stores", "/stores_goods_in", "/complete", "/MU"] + [f"/{slug}" for slug in main.slug_to_excel_name]
+    for route in routes:
+        results = {}
+        for enabled in (False, True):
+            main.snapshot_cache.enabled = enabled
+            client.get(route)  # warm up (fills the cache when enabled)
+            started = time.perf_counter()
+            for _ in range(requests_per_route):
+                client.get(route)
+            results[enabled] = requests_per_route / (time.perf_counter() - started)
+        print(f"{route:24} uncached {results[False]:8.1f} req/s   cached {results[True]:8.1f} req/s"
+              f"  ({results[True] / results[False]:.1f}x)")
+    print("cache:", main.snapshot_cache.stats())
+
+
+def make_work_order_frame(rows):
+    """A cleaned stores_data-style frame, as the dashboard functions see it before building records"""
+    today = pd.Timestamp(datetime.today().date())
+    df = pd.DataFrame({
+        "startdate": [today - pd.Timedelta(days=i % 40) + pd.Timedelta(hours=i % 9) if i % 17 else pd.NaT
+                      for i in range(rows)],
+        "worksordernumber": [f"WO{i:07d}" for i in range(rows)],
+        "partnumber": [f"P-{i % 977:05d}" if i % 23 else None for i in range(rows)],
+        "totalhours": [(i % 37) * 0.25 for i in range(rows)],
+        "partsqty": [float(i % 50) for i in range(rows)],
+        "wo status": [["Released", "In Progress", "Allocated"][i % 3] for i in range(rows)],
+        "printing status": ["Printed" if i % 2 else "Not Printed" for i in range(rows)],
+    })
+    return df.sort_values(by="startdate", ascending=False)
+
+
+def bench_work_orders(sizes=(1_000, 10_000, 100_000)):
+    """iterrows loop vs the column-vectorized summarize_work_orders (equivalence: tests/test_work_orders.py)"""
+    from main import summarize_work_orders
+    from tests.legacy import work_orders_iterrows
+
+    for rows in sizes:
+        df = make_work_order_frame(rows)
+        started = time.perf_counter()
+        work_orders_iterrows(df)
+        old_time = time.perf_counter() - started
+        started = time.perf_counter()
+        summarize_work_orders(df)
+        new_time = time.perf_counter() - started
+        print(f"work orders, {rows:>7} rows: iterrows {old_time * 1000:9.1f} ms   "
+              f"vectorized {new_time * 1000:8.1f} ms  ({old_time / new_time:.0f}x)")
+
+
+def bench_machine_lookup(sizes=(100_000, 500_000), lookups=50):
+    """Machine page query: TRIM(...) LIKE '%name%' full scan vs indexed machine_key equality (SQLite)"""
+    import sqlite3
+    from main import add_machine_keys, machine_slug_from_name
+
+    for rows in sizes:
+        df = pd.DataFrame([_block_row("vacuum", i, datetime(2025, 1, 1)) for i in range(rows)],
+                          columns=["resourcedescription", "startdate", "worksordernumber", "totalhours",
+                                   "partnumber", "partsqty", "wo status"])
+        add_machine_keys(df)
+        conn = sqlite3.connect(":memory:")
+        df.to_sql("vacuum_data", conn, index=False)
+        conn.execute("CREATE INDEX ix_vacuum_data_machine_key ON vacuum_data (machine_key)")
+
+        # Machine page (fetches the rows) and a count over the same predicate (isolates the lookup)
+        timings = {}
+        for label, where, param in (
+            ("scan", "TRIM(resourcedescription) LIKE ?", lambda name: f"%{name}%"),
+            ("key", "machine_key = ?", machine_slug_from_name),
+        ):
+            for kind, select in (("rows", "*"), ("count", "COUNT(*)")):
+                started = time.perf_counter()
+                for i in range(lookups):
+                    name = vacuum_machines[i % len(vacuum_machines)]
+                    conn.execute(f"SELECT {select} FROM vacuum_data WHERE {where}", (param(name),)).fetchall()
+                timings[label, kind] = (time.perf_counter() - started) / lookups * 1000
+        conn.close()
+        print(f"machine lookup, {rows} rows:")
+        for kind in ("rows", "count"):
+            print(f"  {kind:5}  LIKE scan {timings['scan', kind]:7.1f} ms   indexed key {timings['key', kind]:7.1f} ms"
+                  f"  ({timings['scan', kind] / timings['key', kind]:.1f}x)")
+
+
+utilization_sheet = "Machine Utilisation_PVT"
+utilization_header_row = 37
+utilization_resources = ["VAC_NO.1", "VAC_NO.2", "VAC_NO.3", "VAC_NO.4", "VAC_NO.5", "VAC_NO.6", "VAC_NO.7",
+                         "TRIM_NO.1", "TRIM_NO.2"]
+
+
+def make_utilization_workbook(rows):
+    """Build a synthetic "KPI Plan vs Actual" workbook with `rows` BookingWeek/ResourceCode lines"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(utilization_sheet)
+    for _ in range(utilization_header_row):
+        ws.append([])
+    ws.append(["BookingWeek", "ResourceCode", "Max of AvailableHoursPerWeek", "Sum of Total actual time_Hrs"])
+    for i in range(rows):
+        # Mix of plain week numbers and dates, as in the real sheet
+        week = (i // len(utilization_resources)) % 52 + 1
+        booking_week = week if i % 2 else datetime(2025, 1, 6) + timedelta(weeks=week - 1)
+        ws.append([booking_week, utilization_resources[i % len(utilization_resources)], 80, round((i % 90) * 1.1, 1)])
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def bench_ingest(sizes=(10_000, 50_000), latency=2.0):
+    """
+    Wall clock of a full ingest (both workbooks), sequential vs overlapped, into a fresh SQLite DB.
+    SharePoint is replaced by a fake downloader that serves fixture workbooks after `latency` seconds.
+    """
+    import os
+    import tempfile
+    import main
+
+    for rows in sizes:
+        plan, utilization = make_plan_workbook(rows), make_utilization_workbook(rows)
+
+        def slow(content):
+            time.sleep(latency)
+            return BytesIO(content)
+
+        timings = {}
+        # Patched for this benchmark only, so later ones (e.g. `ingest app`) see the real functions
+        with patch.object(main, "get_sharepoint_item", lambda path: {"id": "plan", "cTag": "plan-v1"}), \
+                patch.object(main, "download_sharepoint_file", lambda path: slow(plan)), \
+                patch.object(main, "download_excel_from_sharepoint",
+                             lambda known_version=None: (slow(utilization), "utilization-v1")):
+            for parallel in (False, True):
+                with tempfile.TemporaryDirectory() as tmp:
+                    main.bank = f"sqlite:///{os.path.join(tmp, 'ingest.db')}"
+                    main._engine = None
+                    report = main.ingest(parallel=parallel)
+                    main.get_engine().dispose()
+                assert all(entry["status"] == "loaded" for entry in report["sources"].values()), report
+                timings[parallel] = report["seconds"]
+
+        print(f"ingest, {rows} rows per workbook, {latency}s download latency:")
+        print(f"  sequential {timings[False]:7.2f}s   overlapped {timings[True]:7.2f}s"
+              f"  ({timings[False] / timings[True]:.1f}x)")
+
+
+def _random_booking_week(rng):
+    """One BookingWeek cell as it can appear in the sheet: week numbers, dates, blanks or junk"""
+    week = rng.randint(1, 53)
+    day = datetime(2023, 1, 1) + timedelta(days=rng.randint(0, 3 * 365))
+    return rng.choice([
+        lambda: week,
+        lambda: float(week),
+        lambda: week + rng.random(),
+        lambda: str(week),
+        lambda: f" {week}.0 ",
+        lambda: f"{week}.",
+        lambda: day,
+        lambda: pd.Timestamp(day),
+        lambda: day.date(),
+        lambda: day.strftime("%Y-%m-%d"),
+        lambda: day.strftime("%d %b %Y"),
+        lambda: None,
+        lambda: float("nan"),
+        lambda: "",
+        lambda: f"Week {week}",
+        lambda: "n/a",
+    ])()
+
+
+def make_booking_weeks(rows, seed=0):
+    import random
+    rng = random.Random(seed)
+    return pd.Series([_random_booking_week(rng) for _ in range(rows)], dtype=object)
+
+
+def bench_booking_weeks(sizes=(10_000, 100_000)):
+    """Per-row format_week apply vs the vectorized normalize_booking_weeks (equivalence: tests/test_booking_weeks.py)"""
+    from main import normalize_booking_weeks
+    from tests.legacy import format_week_apply
+
+    for rows in sizes:
+        values = make_booking_weeks(rows)
+        started = time.perf_counter()
+        old = values.apply(format_week_apply)
+        old_time = time.perf_counter() - started
+        started = time.perf_counter()
+        new = normalize_booking_weeks(values)
+        new_time = time.perf_counter() - started
+        assert (old.isna() == new["Week"].isna()).all()
+        print(f"booking weeks, {rows:>7} rows: apply {old_time * 1000:9.1f} ms   "
+              f"vectorized {new_time * 1000:8.1f} ms  ({old_time / new_time:.0f}x)")
+
+
+def bench_history(snapshots=50_000, work_orders=2_000, changes_per_run=5, queries=50):
+    """
+    Snapshot history at scale (SQLite): `snapshots` 10-minute runs, each editing `changes_per_run` of
+    `work_orders` vacuum work orders. Times as_of queries before and after retention/compaction.
+    """
+    import os
+    import random
+    import tempfile
+    from sqlalchemy import create_engine, func, insert, select
+    from main import add_machine_keys
+    from plan_history import (compact_history, ingest_runs, metadata, plan_history, record_snapshot, run_as_of,
+                              snapshot_frame)
+
+    columns = ["resourcedescription", "startdate", "worksordernumber", "totalhours", "partnumber", "partsqty",
+               "wo status"]
+    start = datetime(2025, 1, 1)
+    df = pd.DataFrame([_block_row("vacuum", i, start) for i in range(work_orders)], columns=columns)
+    add_machine_keys(df)
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'history.db')}")
+        first_run = datetime.now() - timedelta(minutes=10 * snapshots)
+        with engine.begin() as conn:
+            record_snapshot(conn, {"vacuum_data": df}, started_at=first_run)
+
+        # Bulk-build the remaining runs the way record_snapshot would store them
+        started = time.perf_counter()
+        row_json = [json.loads(row) for row in df.to_json(orient="records", lines=True,
+                                                           date_format="iso").rstrip("\n").split("\n")]
+        runs, versions, closing = [], [], {}
+        open_version = {wo: None for wo in df["worksordernumber"]}
+        for run_id in range(2, snapshots + 1):
+            runs.append({"run_id": run_id, "source": "plan", "started_at": first_run + timedelta(minutes=10 * run_id)})
+            for i in rng.sample(range(work_orders), changes_per_run):
+                wo = df.at[i, "worksordernumber"]
+                df.at[i, "totalhours"] = row_json[i]["totalhours"] = round(rng.random() * 10, 2)
+                if open_version[wo] is not None:
+                    versions[open_version[wo]]["valid_to"] = run_id
+                else:
+                    closing[wo] = run_id  # closes the version from the first run
+                open_version[wo] = len(versions)
+                versions.append({"table_name": "vacuum_data", "worksordernumber": wo,
+                                 "machine_key": df.at[i, "machine_key"], "valid_from": run_id, "valid_to": None,
+                                 "row_data": json.dumps(row_json[i], separators=(",", ":"))})
+        with engine.begin() as conn:
+            conn.execute(insert(ingest_runs), runs)
+            for wo, run_id in closing.items():
+                conn.execute(plan_history.update().where(plan_history.c.worksordernumber == wo,
+                                                         plan_history.c.valid_from == 1).values(valid_to=run_id))
+            conn.execute(insert(plan_history), versions)
+        build_time = time.perf_counter() - started
+
+        def timed_queries(label):
+            with engine.connect() as conn:
+                count = conn.execute(select(func.count()).select_from(plan_history)).scalar()
+                run_count = conn.execute(select(func.count()).select_from(ingest_runs)).scalar()
+                oldest = conn.execute(select(func.min(ingest_runs.c.started_at))).scalar()
+                newest = conn.execute(select(func.max(ingest_runs.c.started_at))).scalar()
+                timings = {}
+                for kind, machine_key in (("machine", "yellow-cannon"), ("table", None)):
+                    started = time.perf_counter()
+                    for _ in range(queries):
+                        as_of = oldest + (newest - oldest) * rng.random()
+                        snapshot_frame(conn, "vacuum_data", run_as_of(conn, as_of), machine_key, ["startdate"])
+                    timings[kind] = (time.perf_counter() - started) / queries * 1000
+            print(f"  {label:18} {run_count:7} runs {count:8} versions   as_of machine page "
+                  f"{timings['machine']:6.1f} ms   whole table {timings['table']:6.1f} ms")
+
+        print(f"history, {snapshots} snapshots x {changes_per_run} changed of {work_orders} work orders "
+              f"(built in {build_time:.1f}s):")
+        timed_queries("before compaction")
+
+        with engine.begin() as conn:
+            started = time.perf_counter()
+            changed = df.sample(changes_per_run, random_state=1).index
+            df.loc[changed, "totalhours"] += 1
+            record_snapshot(conn, {"vacuum_data": df})
+            print(f"  recording one more run: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            started = time.perf_counter()
+            result = compact_history(conn, retention_days=180, daily_after_days=7)
+            print(f"  compaction (180 days, daily after 7): {time.perf_counter() - started:.1f}s, {result}")
+        timed_queries("after compaction")
+        engine.dispose()
+
+
+export_columns = ["resourcedescription", "startdate", "worksordernumber", "totalhours", "partnumber", "partsqty",
+                  "wo status", "machine_key"]
+
+
+def make_export_db(path, rows):
+    """SQLite DB at `path` with a `rows`-row vacuum_data table, as the ingest writes it"""
+    import sqlite3
+
+    start = datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE vacuum_data (resourcedescription TEXT, startdate TIMESTAMP, '
+                 'worksordernumber TEXT, totalhours FLOAT, partnumber TEXT, partsqty BIGINT, '
+                 '"wo status" TEXT, machine_key TEXT)')
+    conn.executemany("INSERT INTO vacuum_data VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     ((*_block_row("vacuum", i, start)[:1], (start + timedelta(days=i % 60)).isoformat(" "),
+                       *_block_row("vacuum", i, start)[2:], "yellow-cannon") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def export_peak(client, fmt, table="vacuum"):
+    """Peak Python memory (plus pyarrow's pool for Parquet) while streaming /export/<table>.<fmt>"""
+    def run():
+        response = client.get(f"/export/{table}.{fmt}", buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size
+
+    size, elapsed, peak = _measure(run)
+    if fmt == "parquet":
+        # Arrow buffers live outside tracemalloc's view; its pool keeps its own high-water mark
+        import pyarrow as pa
+        peak += pa.default_memory_pool().max_memory()
+    return size, elapsed, peak
+
+
+def bench_export(sizes=(1_000_000,)):
+    """
+    Peak Python memory while streaming /export/vacuum.csv and .parquet for a `rows`-row table (SQLite),
+    next to materializing the same table with read_sql. tests/test_export.py holds the memory bound.
+    """
+    import os
+    import tempfile
+    import main
+
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.db")
+            make_export_db(path, rows)
+            main.bank = f"sqlite:///{path}"
+            main._engine = None
+            client = main.app.test_client()
+
+            print(f"export, {rows} rows:")
+            for fmt in ("csv", "parquet"):
+                size, elapsed, peak = export_peak(client, fmt)
+                print(f"  {fmt + ' stream':22} {elapsed:6.2f}s  peak {peak / 1e6:7.1f} MB  ({size / 1e6:.1f} MB sent)")
+            _, elapsed, peak = _measure(lambda: len(pd.read_sql("SELECT * FROM vacuum_data", main.get_engine())))
+            print(f"  {'read_sql (reference)':22} {elapsed:6.2f}s  peak {peak / 1e6:7.1f} MB")
+            main.get_engine().dispose()
+
+class FakeGraphSession:
+    """
+    Stands in for GraphClient's requests.Session: answers the handful of Graph endpoints the app
+    calls (site, drives, item by path or id, item content) from in-memory workbooks, so the real
+    fetch code runs with no network. `latency` seconds are added to every content download.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.files = {}  # drive-relative path → {"id", "version", "content"}
+        self.calls = 0
+
+    def publish(self, path, content):
+        """Put a new version of the file at `path` (its cTag changes, like a save in SharePoint)"""
+        path = path.strip("/")
+        current = self.files.get(path)
+        if current is None:
+            current = {"id": f"item-{len(self.files) + 1}", "version": 0}
+        self.files[path] = {"id": current["id"], "version": current["version"] + 1, "content": content}
+
+    def _item(self, entry):
+        return {"id": entry["id"], "cTag": f"c{entry['version']}", "eTag": f"e{entry['version']}"}
+
+    def request(self, method, url, headers=None, params=None, **kwargs):
+        from urllib.parse import unquote
+
+        self.calls += 1
+        path = unquote(url.split("/v1.0/", 1)[-1])
+        by_id = {entry["id"]: entry for entry in self.files.values()}
+        if path.startswith("sites/") and path.endswith("/drives"):
+            return self._response(200, {"value": [{"id": "drive", "name": "Documents"}]})
+        if path.startswith("sites/"):
+            return self._response(200, {"id": "site"})
+        if path.startswith("drives/drive/root:/"):
+            entry = self.files.get(path[len("drives/drive/root:/"):].strip("/"))
+            return self._response(200, self._item(entry)) if entry else self._response(404, {})
+        if path.startswith("drives/drive/items/"):
+            item_id, _, rest = path[len("drives/drive/items/"):].partition("/")
+            entry = by_id.get(item_id)
+            if entry is None:
+                return self._response(404, {})
+            if rest == "content":
+                time.sleep(self.latency)
+                return self._response(200, content=entry["content"])
+            return self._response(200, self._item(entry))
+        return self._response(404, {})
+
+    @staticmethod
+    def _response(status, body=None, content=None):
+        import requests
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = content if content is not None else json.dumps(body).encode()
+        return response
+
+
+def offline_app(db_path, plan, utilization, latency=0.0):
+    """
+    Point main at a fresh SQLite DB and a fake Graph serving the `plan` and `utilization`
+    workbook bytes. Returns (main, fake session); publish new bytes on the session to simulate an edit.
+    """
+    import main
+    from graph_client import GraphClient
+
+    session = FakeGraphSession(latency)
+    session.publish(main.file_url_pvt, plan)
+    session.publish(main.file_url, utilization)
+    if main._engine is not None:
+        main._engine.dispose()
+    main.bank = f"sqlite:///{db_path}"
+    main._engine = None
+    main._site_and_drive = None
+    main.graph = GraphClient(lambda: {"access_token": "offline", "expires_in": 3600}, session=session)
+    main.snapshot_cache.bump()
+    return main, session
+
+
+def app_routes(main):
+    """Every GET route of the app, with path arguments expanded to each machine/section/table"""
+    values = {
+        "machine_slug": list(main.slug_to_excel_name),
+        "section": list(main.complete_sections),
+        "name": list(main.export_tables),
+    }
+    routes = []
+    for rule in main.app.url_map.iter_rules():
+        if "GET" not in rule.methods or rule.endpoint == "static":
+            continue
+        args = [arg for arg in rule.arguments if arg not in (rule.defaults or {})]
+        combos = [{}]
+        for arg in args:
+            combos = [{**combo, arg: value} for combo in combos for value in values[arg]]
+        for combo in combos:
+            path = rule.rule
+            for arg, value in combo.items():
+                path = path.replace(f"<{arg}>", value)
+            routes.append(path)
+    return sorted(set(routes))
+
+
+def _hit_route(main, route, requests_total, concurrency):
+    """Latency stats for `requests_total` GETs of `route`, spread over `concurrency` threads"""
+    from concurrent.futures import ThreadPoolExecutor
+    import numpy as np
+
+    def worker(count):
+        client = main.app.test_client()
+        latencies, statuses = [], {}
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(route)
+            response.get_data()  # drain streamed bodies (exports) inside the timing
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return latencies, statuses
+
+    shares = [requests_total // concurrency + (i < requests_total % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+    latencies = np.array([latency for result, _ in results for latency in result]) * 1000
+    statuses = {}
+    for _, counts in results:
+        for status, count in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "requests": requests_total,
+        "requests_per_second": round(requests_total / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+        "statuses": statuses,
+    }
+
+
+def bench_app(sizes=(5_000,), concurrency=(1, 8), requests_per_route=40, latency=0.0):
+    """
+    The whole app offline: synthetic workbooks behind a fake Graph, a fresh SQLite DB per size.
+    Times create_db_and_load_excel and update_machine_utilization (cold load, unchanged re-check,
+    edited workbook), then every GET route through the Flask test client at each concurrency.
+    :return: JSON-friendly results, keyed by row count.
+    """
+    import os
+    import tempfile
+
+    results = {}
+    for rows in sizes:
+        plan, utilization = make_plan_workbook(rows), make_utilization_workbook(rows)
+        with tempfile.TemporaryDirectory() as tmp:
+            main, graph = offline_app(os.path.join(tmp, "app.db"), plan, utilization, latency)
+
+            def timed(func):
+                started = time.perf_counter()
+                result = func()
+                return {"seconds": round(time.perf_counter() - started, 3), "result": repr(result)}
+
+            ingest = {
+                "plan_cold": timed(main.create_db_and_load_excel),
+                "plan_unchanged": timed(main.create_db_and_load_excel),
+                "utilization_cold": timed(lambda: main.update_machine_utilization() is not None),
+                "utilization_unchanged": timed(lambda: main.update_machine_utilization() is not None),
+            }
+            # An edit: 1% more work orders, everything else identical
+            graph.publish(main.file_url_pvt, make_plan_workbook(rows + max(rows // 100, 1)))
+            ingest["plan_edited"] = timed(main.create_db_and_load_excel)
+            graph.publish(main.file_url, make_utilization_workbook(rows + max(rows // 100, 1)))
+            ingest["utilization_edited"] = timed(lambda: main.update_machine_utilization() is not None)
+
+            routes = {}
+            for route in app_routes(main):
+                client = main.app.test_client()
+                started = time.perf_counter()
+                first = client.get(route)
+                first.get_data()
+                routes[route] = {"first_ms": round((time.perf_counter() - started) * 1000, 3),
+                                 "status": first.status_code}
+                for threads in concurrency:
+                    routes[route][f"c{threads}"] = _hit_route(main, route, requests_per_route, threads)
+            main.get_engine().dispose()
+
+        results[str(rows)] = {"ingest": ingest, "routes": routes, "graph_calls": graph.calls}
+        print(f"app, {rows} rows per workbook:")
+        for name, timing in ingest.items():
+            print(f"  {name:24} {timing['seconds']:8.3f}s  {timing['result']}")
+        print(f"  {'route':40} {'first':>9}" + "".join(f"  {f'c{t} req/s':>10} {'p95':>9}" for t in concurrency))
+        for route, stats in routes.items():
+            print(f"  {route:40} {stats['first_ms']:7.1f}ms" + "".join(
+                f"  {stats[f'c{t}']['requests_per_second']:10.1f} {stats[f'c{t}']['p95_ms']:7.1f}ms"
+                for t in concurrency) + ("" if stats["status"] < 400 else f"  [{stats['status']}]"))
+    return results
+
+
+def bench_schedule(sizes=(100_000, 1_000_000), machines=10):
+    """
+    capacity.project_schedule for `machines` machines over `rows` orders in total (correctness:
+    tests/test_schedule.py). Must stay well under a second at 100k.
+    """
+    import numpy as np
+    from capacity import project_schedule
+
+    rng = np.random.default_rng(1)
+    start = pd.Timestamp("2025-01-08")
+    weeks = pd.date_range("2024-12-30", periods=52, freq="W-MON")
+    capacity = {f"m{m}": pd.Series(rng.choice([60.0, 80.0, 100.0], len(weeks)), index=weeks)
+                for m in range(machines)}
+    results = {}
+    for rows in sizes:
+        df = pd.DataFrame({
+            "machine_key": rng.integers(0, machines, rows).astype(str),
+            "startdate": start + pd.to_timedelta(rng.integers(-30, 120, rows), unit="D"),
+            "totalhours": np.round(rng.random(rows) * 10, 2),
+        })
+        df["machine_key"] = "m" + df["machine_key"]
+        started = time.perf_counter()
+        schedule = project_schedule(df, capacity, start, 80.0)
+        elapsed = time.perf_counter() - started
+        results[str(rows)] = {"seconds": round(elapsed, 3)}
+        print(f"schedule, {machines} machines x {rows} orders: {elapsed:.3f}s"
+              f"  (last order clears {schedule['projected_finish'].max():%Y-%m-%d})")
+        if rows <= 100_000:
+            assert elapsed < 1.0, f"{rows} orders took {elapsed:.2f}s"
+    return results
+
+
+def bench_schema(sizes=(100_000,), reads=20):
+    """
+    Inferred vs declared (plan_schema) column types for a `rows`-row vacuum table: frame memory,
+    and the machine-page read (SQLite): read_sql plus the per-request coercion the readers used to
+    do, vs read_plan_table on a table written with the declared DDL.
+    """
+    import os
+    import tempfile
+    from sqlalchemy import create_engine, text
+    import main
+    from plan_schema import apply_schema, column_sql_types
+
+    start = datetime(2025, 1, 1)
+    results = {}
+    for rows in sizes:
+        raw = pd.DataFrame([_block_row("vacuum", i, start) for i in range(rows)], columns=plan_headers["vacuum"])
+        raw = main.add_machine_keys(main.clean_and_prepare_df(raw, main.column_rename_map_vacuum))
+        typed = apply_schema(raw.copy())
+        memory = {"inferred": raw.memory_usage(deep=True).sum(), "typed": typed.memory_usage(deep=True).sum()}
+
+        def old_read(conn):
+            df = pd.read_sql_query(text("SELECT * FROM vacuum_data WHERE machine_key = :k"), conn,
+                                   params={"k": "yellow-cannon"})
+            df["startdate"] = pd.to_datetime(df["startdate"], errors="coerce")
+            df["totalhours"] = pd.to_numeric(df["totalhours"], errors="coerce").fillna(0)
+            df["partsqty"] = pd.to_numeric(df["partsqty"], errors="coerce").fillna(0)
+            return df
+
+        def new_read(conn):
+            df = main.read_plan_table(conn, "vacuum_data", machine_key="yellow-cannon")
+            df["totalhours"] = df["totalhours"].fillna(0)
+            df["partsqty"] = df["partsqty"].fillna(0)
+            return df
+
+        latency = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, frame, dtype, read in (("inferred", raw, None, old_read),
+                                              ("typed", typed, column_sql_types(typed.columns), new_read)):
+                engine = create_engine(f"sqlite:///{os.path.join(tmp, f'{label}.db')}")
+                with engine.begin() as conn:
+                    frame.to_sql("vacuum_data", conn, index=False, dtype=dtype)
+                    conn.exec_driver_sql("CREATE INDEX ix_machine_key ON vacuum_data (machine_key)")
+                with engine.connect() as conn:
+                    read(conn)
+                    started = time.perf_counter()
+                    for _ in range(reads):
+                        df = read(conn)
+                    latency[label] = (time.perf_counter() - started) / reads
+                    memory[f"{label}_read"] = df.memory_usage(deep=True).sum()
+                engine.dispose()
+
+        results[str(rows)] = {"memory_mb": {k: round(v / 1e6, 2) for k, v in memory.items()},
+                              "read_seconds": {k: round(v, 4) for k, v in latency.items()}}
+        print(f"schema, {rows} rows:")
+        print(f"  frame memory    inferred {memory['inferred'] / 1e6:8.1f} MB   typed {memory['typed'] / 1e6:8.1f} MB"
+              f"  ({memory['inferred'] / memory['typed']:.1f}x smaller)")
+        print(f"  machine read    inferred {latency['inferred'] * 1000:8.1f} ms   typed {latency['typed'] * 1000:8.1f} ms"
+              f"  ({len(df)} rows; read frame {memory['inferred_read'] / 1e6:.1f} MB vs {memory['typed_read'] / 1e6:.1f} MB)")
+    return results
+
+
+def bench_machine_page(sizes=(5_000,), requests_total=50):
+    """
+    One machine page (Yellow Cannon) with a `rows`-row backlog, offline: the rows fragment and the
+    shell rendered from scratch, the precompression, and GETs with the snapshot cache off (render
+    per request, as the per-machine templates did) vs on (precompressed body served as is).
+    """
+    import os
+    import tempfile
+
+    results = {}
+    for rows in sizes:
+        # make_plan_workbook deals work orders round-robin over the five vacuum machines
+        plan = make_plan_workbook(rows * len(vacuum_machines))
+        with tempfile.TemporaryDirectory() as tmp:
+            main, _ = offline_app(os.path.join(tmp, "page.db"), plan, make_utilization_workbook(100))
+            main.create_db_and_load_excel()
+            args = ("Yellow Cannon", "vacuum")
+
+            def timed(func, repeat=5):
+                func()
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    value = func()
+                return value, (time.perf_counter() - started) / repeat
+
+            with main.app.test_request_context("/yellow-cannon"):
+                main.get_dashboard_data(*args)
+                fragment, rows_time = timed(lambda: main.get_machine_rows.uncached(*args))
+                bodies, page_time = timed(lambda: main.get_machine_page.uncached(*args))
+                _, gzip_time = timed(lambda: main.gzip.compress(bodies["identity"], compresslevel=9, mtime=0))
+                br_time = None
+                if main.brotli is not None:
+                    _, br_time = timed(lambda: main.brotli.compress(bodies["identity"], mode=main.brotli.MODE_TEXT,
+                                                                      quality=9))
+
+            client = main.app.test_client()
+            latency = {}
+            for label, enabled, encoding in (("uncached", False, "identity"), ("cached", True, "identity"),
+                                             ("cached_gzip", True, "gzip"), ("cached_br", True, "br, gzip")):
+                main.snapshot_cache.enabled = enabled
+                response = client.get("/yellow-cannon", headers={"Accept-Encoding": encoding})
+                started = time.perf_counter()
+                for _ in range(requests_total):
+                    client.get("/yellow-cannon", headers={"Accept-Encoding": encoding}).get_data()
+                latency[label] = {"ms": round((time.perf_counter() - started) / requests_total * 1000, 3),
+                                  "bytes": len(response.get_data()),
+                                  "encoding": response.headers.get("Content-Encoding", "identity")}
+            main.snapshot_cache.enabled = True
+            main.get_engine().dispose()
+
+        results[str(rows)] = {
+            "render_ms": {"rows": round(rows_time * 1000, 2), "page": round(page_time * 1000, 2),
+                          "gzip": round(gzip_time * 1000, 2),
+                          "br": None if br_time is None else round(br_time * 1000, 2)},
+            "requests": latency,
+        }
+        print(f"machine page, {rows} work orders ({len(fragment) / 1e6:.2f} MB of rows):")
+        print(f"  render rows {rows_time * 1000:8.1f} ms   page around the cached rows + compress {page_time * 1000:8.1f} ms"
+              f"   (gzip {gzip_time * 1000:.1f} ms" + ("" if br_time is None else f", br {br_time * 1000:.1f} ms") + ")")
+        for label, stats in latency.items():
+            print(f"  GET {label:12} {stats['ms']:8.2f} ms  {stats['bytes'] / 1e3:9.1f} kB  {stats['encoding']}")
+    return results
+
+
+def bench_bulk_load(sizes=(10_000, 100_000, 1_000_000), database=None, multi_max_rows=100_000):
+    """
+    Rows/sec loading a `rows`-row vacuum table: to_sql(method="multi"), the old first-load path,
+    vs bulk_load (COPY on PostgreSQL, executemany batches elsewhere). Runs against `database`
+    (a SQLAlchemy URL; default BENCH_DATABASE, e.g. a scratch PostgreSQL) or a temporary SQLite file.
+    A path that fails (e.g. too many bind parameters) is reported with its error; to_sql_multi is
+    skipped above `multi_max_rows` (at 1M rows it ran for 10+ minutes and 2 GB without finishing).
+    """
+    import os
+    import tempfile
+    from sqlalchemy import create_engine, text
+    import main
+    from bulk_load import bulk_load
+    from plan_schema import apply_schema, column_sql_types
+
+    start = datetime(2025, 1, 1)
+    paths = {
+        "to_sql_multi": lambda conn, table, df, dtype: df.to_sql(table, conn, index=False, method="multi", dtype=dtype),
+        "bulk_load": lambda conn, table, df, dtype: bulk_load(conn, table, df, dtype=dtype),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = database or os.getenv("BENCH_DATABASE") or f"sqlite:///{os.path.join(tmp, 'bulk.db')}"
+        engine = create_engine(database)
+        for rows in sizes:
+            raw = pd.DataFrame([_block_row("vacuum", i, start) for i in range(rows)], columns=plan_headers["vacuum"])
+            df = apply_schema(main.add_machine_keys(main.clean_and_prepare_df(raw, main.column_rename_map_vacuum)))
+            dtype = column_sql_types(df.columns)
+            results[str(rows)] = {}
+            for label, load in paths.items():
+                table = f"bench_bulk_{label}"
+                if label == "to_sql_multi" and rows > multi_max_rows:
+                    results[str(rows)][label] = {"error": f"skipped (over {multi_max_rows:,} rows)"}
+                    continue
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+                    started = time.perf_counter()
+                    with engine.begin() as conn:
+                        load(conn, table, df, dtype)
+                    elapsed = time.perf_counter() - started
+                    with engine.connect() as conn:
+                        loaded = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                    assert loaded == rows, f"{label} loaded {loaded} of {rows} rows"
+                    results[str(rows)][label] = {"seconds": round(elapsed, 3), "rows_per_second": round(rows / elapsed)}
+                except Exception as e:
+                    results[str(rows)][label] = {"error": f"{type(e).__name__}: {str(e).splitlines()[0][:120]}"}
+            with engine.begin() as conn:
+                for label in paths:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "bench_bulk_{label}"'))
+        dialect = engine.dialect.name
+        engine.dispose()
+
+    for rows, by_path in results.items():
+        print(f"bulk load ({dialect}), {rows} rows:")
+        for label, stats in by_path.items():
+            print(f"  {label:14} " + (stats["error"] if "error" in stats else
+                                      f"{stats['seconds']:8.2f}s  {stats['rows_per_second']:10,} rows/s"))
+    return results
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}/")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare_results(old, new, tolerance=0.2):
+    """
+    Print the timings in `new` that regressed by more than `tolerance` against `old` (two --json
+    outputs). Seconds/ms are lower-is-better, */second higher-is-better. Returns the regressions.
+    """
+    old_values = dict(_flatten(old.get("results", old)))
+    regressions = []
+    for key, value in _flatten(new.get("results", new)):
+        before = old_values.get(key)
+        if not before or not value:
+            continue
+        if key.endswith(("seconds", "_ms")):
+            ratio = value / before
+        elif key.endswith("per_second"):
+            ratio = before / value
+        else:
+            continue
+        if ratio > 1 + tolerance:
+            regressions.append((key, before, value, ratio))
+    for key, before, value, ratio in sorted(regressions, key=lambda r: -r[3]):
+        print(f"  {key:70} {before:10.3f} -> {value:10.3f}  ({ratio:.2f}x worse)")
+    print(f"{len(regressions)} regression(s) over {tolerance:.0%}")
+    return regressions
+
+
+def run_metadata():
+    import os
+    import platform
+    import subprocess
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__}
+
+
+benchmarks = {
+    "plan-parse": bench_plan_parse,
+    "dashboard-cache": bench_dashboard_cache,
+    "work-orders": bench_work_orders,
+    "machine-lookup": bench_machine_lookup,
+    "ingest": bench_ingest,
+    "booking-weeks": bench_booking_weeks,
+    "history": bench_history,
+    "export": bench_export,
+    "app": bench_app,
+    "schedule": bench_schedule,
+    "schema": bench_schema,
+    "machine-page": bench_machine_page,
+    "bulk-load": bench_bulk_load,
+}
+
+if __name__ == "__main__":
+    # Usage: python benchmark.py [name ...] [--rows N,N] [--json out.json] [--compare old.json]
+    args = sys.argv[1:]
+    kwargs, options = {}, {}
+    for flag in ("--rows", "--json", "--compare"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if "--rows" in options:
+        kwargs["sizes"] = tuple(int(n) for n in options["--rows"].split(","))
+    output = {"meta": run_metadata(), "results": {}}
+    for name in args or ["plan-parse"]:
+        func = benchmarks[name]
+        accepted = inspect.signature(func).parameters
+        result = func(**{k: v for k, v in kwargs.items() if k in accepted})
+        if result is not None:
+            output["results"][name] = result
+    if "--json" in options:
+        with open(options["--json"], "w") as f:
+            json.dump(output, f, indent=2)
+    if "--compare" in options:
+        with open(options["--compare"]) as f:
+            compare_results(json.load(f), output)
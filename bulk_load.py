@@ -0,0 +1,76 @@
+from io import StringIO
+
+import pandas as pd
+from sqlalchemy import MetaData, Table
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def frame_rows(df):
+    """df's rows as tuples of plain Python values (None for missing), converted a column at a time"""
+    columns = []
+    for _, series in df.items():
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = list(pd.DatetimeIndex(series).to_pydatetime())
+        else:
+            values = series.astype(object).tolist()
+        missing = series.isna()
+        if missing.any():
+            values = [None if is_missing else value for value, is_missing in zip(values, missing.tolist())]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+# COPY's text format: tab-separated, \N for NULL, backslash escapes for the separators
+_copy_escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_batch(rows):
+    buffer = StringIO()
+    buffer.writelines("\t".join("\\N" if value is None else str(value).translate(_copy_escapes) for value in row) + "\n"
+                      for row in rows)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(conn, table, columns, rows, batch_size=50_000):
+    """PostgreSQL via psycopg2: COPY ... FROM STDIN, one in-memory buffer of `batch_size` rows at a time"""
+    sql = f"COPY {_quote(table)} ({', '.join(map(_quote, columns))}) FROM STDIN"
+    # The driver connection behind `conn`, so the COPY runs in the caller's transaction
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.copy_expert(sql, _copy_batch(rows[start:start + batch_size]))
+
+
+def insert_rows(conn, table, columns, rows, batch_size=50_000):
+    """Any other database or driver: executemany INSERTs of `batch_size` rows, through the reflected column types"""
+    db_table = Table(table, MetaData(), autoload_with=conn)
+    statement = db_table.insert()
+    for start in range(0, len(rows), batch_size):
+        conn.execute(statement, [dict(zip(columns, row)) for row in rows[start:start + batch_size]])
+
+
+def load_rows(conn, table, columns, rows, batch_size=50_000):
+    """
+    Append `rows` (tuples in `columns` order) to an existing table: COPY on PostgreSQL through
+    psycopg2, batched INSERTs with any other driver (psycopg 3, pg8000, SQLite)
+    """
+    if not rows:
+        return 0
+    # copy_expert is psycopg2's API, not the dialect's
+    load = copy_rows if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2" else insert_rows
+    load(conn, table, columns, rows, batch_size)
+    return len(rows)
+
+
+def bulk_load(conn, table, df, dtype=None, if_exists="fail", batch_size=50_000):
+    """
+    DataFrame.to_sql(index=False) without the giant multi-row INSERT: the table is created (or
+    replaced/appended to, per `if_exists`) with the DDL pandas would use, then filled by load_rows,
+    so memory and bind parameters stay bounded by `batch_size` whatever the sheet's size.
+    :return: Rows loaded.
+    """
+    df.head(0).to_sql(table, conn, index=False, if_exists=if_exists, dtype=dtype)
+    return load_rows(conn, table, list(df.columns), frame_rows(df), batch_size)
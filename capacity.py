@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+def weekly_capacity(rows, week_start_column="week_start", hours_column="hours"):
+    """Available hours per week as a sorted Series indexed by the Monday of each week"""
+    rows = rows.dropna(subset=[week_start_column, hours_column])
+    return rows.groupby(week_start_column)[hours_column].max().sort_index().astype(float)
+
+
+def daily_capacity(weekly_hours, start, days, default_weekly_hours=0.0, workdays=5):
+    """
+    Available hours for each of `days` days from `start`: a week's hours spread evenly over its
+    first `workdays` days. Weeks without a figure take the latest earlier week's (the first
+    known week's before the data starts); with no figures at all, `default_weekly_hours`.
+    """
+    dates = pd.date_range(start, periods=days, freq="D")
+    hours = hours_for_weeks(weekly_hours, dates - pd.to_timedelta(dates.weekday, unit="D"), default_weekly_hours)
+    return np.where(dates.weekday < workdays, hours / workdays, 0.0)
+
+
+def hours_for_weeks(weekly_hours, week_starts, default_weekly_hours=0.0):
+    """Weekly hours for each week start, filled as described in daily_capacity"""
+    if weekly_hours is None or weekly_hours.empty:
+        return np.full(len(week_starts), float(default_weekly_hours))
+    known = weekly_hours.index.to_numpy(dtype="datetime64[ns]")
+    idx = np.clip(np.searchsorted(known, np.asarray(week_starts, dtype="datetime64[ns]"), side="right") - 1, 0, None)
+    return weekly_hours.to_numpy(dtype=float)[idx]
+
+
+def project_machine(start_dates, hours, weekly_hours, start, default_weekly_hours=0.0, horizon_days=366,
+                    max_horizon_days=366 * 20):
+    """
+    Finite-capacity projection for one machine's queue.
+    Orders run one after another in StartDate order (undated orders last), none before its own
+    StartDate, each consuming `hours` of the machine's available hours from `start` onwards.
+    In capacity units an order finishes at C_i = max(C_i-1, K(release_i)) + p_i, where K is the
+    cumulative available hours; unrolled, that is one cumsum and one running maximum:
+        C = S + maximum.accumulate(K(release) - S_prev)
+    :param start_dates: datetime64 array of planned start dates.
+    :param hours: Hours each order needs (NaN/negative count as 0).
+    :return: (finish dates as datetime64[ns], overload hours), in the input order. Overload is the
+             queued work beyond what the machine can deliver by the end of the order's planned
+             day; NaT/NaN when the order has no start date or never fits in the horizon.
+    """
+    start = pd.Timestamp(start).normalize()
+    dates = pd.DatetimeIndex(start_dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    n = len(dates)
+    if n == 0:
+        return np.array([], dtype="datetime64[ns]"), np.array([], dtype=float)
+
+    undated = dates.isna()
+    planned = ((dates.normalize() - start) // pd.Timedelta(days=1)).to_numpy(dtype=float)
+    planned = np.where(undated, np.nan, planned)
+    release = np.where(undated, 0, np.clip(np.nan_to_num(planned), 0, None)).astype(np.int64)
+    order = np.lexsort((np.arange(n), np.where(undated, np.inf, planned)))
+
+    p = np.clip(np.nan_to_num(np.asarray(hours, dtype=float)[order]), 0, None)
+    cum_work = np.cumsum(p)
+    days = max(horizon_days, int(release.max()) + 1)
+    while True:
+        cum_capacity = np.cumsum(daily_capacity(weekly_hours, start, days, default_weekly_hours))
+        # K(release): capacity used up before the release day starts
+        before = np.concatenate(([0.0], cum_capacity))[release[order]]
+        finish_work = cum_work + np.maximum.accumulate(before - (cum_work - p))
+        if finish_work[-1] <= cum_capacity[-1] + 1e-9 or days >= max_horizon_days:
+            break
+        days = min(days * 2, max_horizon_days)
+
+    finish_day = np.searchsorted(cum_capacity, finish_work - 1e-9, side="left")
+    # Zero-hour orders land on the day their turn comes, not on a day the queue already passed
+    finish_day = np.maximum(finish_day, np.maximum.accumulate(release[order]))
+    fits = finish_day < days
+    finish = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+    finish[order[fits]] = start.to_datetime64() + finish_day[fits].astype("timedelta64[D]")
+
+    # Capacity available by the end of the planned day; nothing for days already past
+    due = planned[order]
+    capacity_by_due = np.where(due >= 0, cum_capacity[np.clip(np.nan_to_num(due), 0, days - 1).astype(np.int64)], 0.0)
+    overload = np.full(n, np.nan)
+    overload[order] = np.where(np.isnan(due) | ~fits, np.nan, np.clip(finish_work - capacity_by_due, 0, None))
+    return finish, overload
+
+
+def project_schedule(df, capacity, start, default_weekly_hours=0.0, machine_column="machine_key",
+                     date_column="startdate", hours_column="totalhours"):
+    """
+    project_machine for every machine in `df`, each against its own weekly hours.
+    :param capacity: {machine: weekly hours Series (see weekly_capacity)}; machines missing from it
+                     use `default_weekly_hours`.
+    :return: DataFrame aligned to df.index with projected_finish and overload_hours.
+    """
+    finish = np.full(len(df), np.datetime64("NaT"), dtype="datetime64[ns]")
+    overload = np.full(len(df), np.nan)
+    dates = pd.to_datetime(df[date_column], errors="coerce")
+    hours = pd.to_numeric(df[hours_column], errors="coerce").to_numpy(dtype=float)
+    for machine, positions in df.groupby(machine_column, sort=False).indices.items():
+        finish[positions], overload[positions] = project_machine(
+            dates.iloc[positions].to_numpy(), hours[positions], capacity.get(machine), start, default_weekly_hours)
+    return pd.DataFrame({"projected_finish": finish, "overload_hours": overload.round(2)}, index=df.index)
+
+
+def summarize_schedule(schedule, hours, weekly_hours, start, default_weekly_hours=0.0):
+    """Machine-level figures for a project_schedule result: queue hours, clear date, overloaded orders"""
+    start = pd.Timestamp(start).normalize()
+    this_week = hours_for_weeks(weekly_hours, [start - pd.Timedelta(days=start.weekday())], default_weekly_hours)[0]
+    source = "default" if weekly_hours is None or weekly_hours.empty else "utilisation"
+    overload = schedule["overload_hours"]
+    return {
+        "queue_hours": round(float(pd.to_numeric(hours, errors="coerce").clip(lower=0).sum()), 2),
+        "weekly_hours": round(float(this_week), 2),
+        "capacity_source": source,
+        "clears_on": schedule["projected_finish"].max(),
+        "overloaded_orders": int((overload > 0).sum()),
+        "max_overload_hours": round(float(overload.max()), 2) if overload.notna().any() else 0.0,
+        "unscheduled_orders": int(schedule["projected_finish"].isna().sum()),
+    }
@@ -0,0 +1,83 @@
+import functools
+import inspect
+import threading
+import time
+from datetime import date
+
+
+class SnapshotCache:
+    """
+    In-process cache of prepared dashboard data, valid for one data version.
+    The version comes from `version_source()` (re-checked at most every `check_interval`
+    seconds, or straight away after `bump()`) plus today's date, since the
+    today/backlog split changes at midnight even without a new ingest.
+    A version change swaps in a fresh, empty snapshot in one assignment, so readers
+    never see entries from two versions mixed together.
+    """
+
+    def __init__(self, version_source, check_interval=5.0, enabled=True):
+        self.version_source = version_source
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._snapshot = {"version": None, "entries": {}}
+        self._checked_at = 0.0
+
+    def version(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            version = (self.version_source(), date.today())
+            if version != self._snapshot["version"]:
+                self._snapshot = {"version": version, "entries": {}}
+        return self._snapshot["version"]
+
+    def bump(self):
+        """Call after a successful ingest: the next read re-checks the version"""
+        self._checked_at = 0.0
+
+    def get(self, key, build):
+        if not self.enabled:
+            return build()
+        self.version()
+        snapshot = self._snapshot
+        if key in snapshot["entries"]:
+            with self._lock:
+                self.hits += 1
+            return snapshot["entries"][key]
+
+        with self._lock:
+            self.misses += 1
+        value = build()
+        # Don't keep failures (None); they're retried on the next request
+        if value is not None:
+            snapshot["entries"][key] = value
+        return value
+
+    def cached(self, name, bypass_arg=None):
+        """
+        Decorator: cache the function's result per (name, args) for the current version.
+        Calls that pass a value for the `bypass_arg` parameter skip the cache: for as_of, every
+        distinct value would otherwise keep a whole dataset until the next version.
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                if bypass_arg is not None and signature.bind(*args).arguments.get(bypass_arg) is not None:
+                    return func(*args)
+                return self.get((name, args), lambda: func(*args))
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            "version": repr(self._snapshot["version"]),
+            "entries": len(self._snapshot["entries"]),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+
+class GraphClient:
+    """
+    Small Microsoft Graph client shared by all SharePoint calls.
+    - one keep-alive requests.Session (connection pooling, no TLS handshake per call)
+    - access token reused until shortly before it expires
+    - path → item-id lookups cached for `item_ttl` seconds
+    - 429/503 responses retried with Retry-After / exponential backoff
+    :param acquire_token: Callable returning an MSAL token result ({"access_token", "expires_in"}).
+    :param base_url: Graph root; point it at a local fake server for testing.
+    """
+
+    retry_statuses = (429, 503)
+
+    def __init__(self, acquire_token, base_url=GRAPH_URL, item_ttl=300, max_retries=4, backoff=1.0, session=None):
+        self.acquire_token = acquire_token
+        self.base_url = base_url.rstrip("/")
+        self.item_ttl = item_ttl
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._token = None
+        self._token_expires = 0
+        self._item_ids = {}
+
+    # --- Auth ---
+    def token(self):
+        with self._lock:
+            # Renew a minute early so a token never expires mid-download
+            if self._token is None or time.time() > self._token_expires - 60:
+                result = self.acquire_token()
+                if "access_token" not in result:
+                    raise Exception(f"Unable to acquire token: {result.get('error_description')}")
+                self._token = result["access_token"]
+                self._token_expires = time.time() + int(result.get("expires_in", 3600))
+            return self._token
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token()}"}
+
+    # --- Requests ---
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, headers=None, **kwargs):
+        """Send a request, retrying throttled/unavailable responses. Returns the final Response."""
+        url = self.url(path)
+        for attempt in range(self.max_retries + 1):
+            response = self.session.request(method, url, headers={**self.headers(), **(headers or {})}, **kwargs)
+            if response.status_code == 401 and attempt == 0:
+                # Token revoked/expired early: fetch a new one and try again
+                with self._lock:
+                    self._token = None
+                continue
+            if response.status_code not in self.retry_statuses or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(response, attempt))
+        return response
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def get_json(self, path, **kwargs):
+        response = self.get(path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    # --- Drive items ---
+    def item(self, drive_id, path, select=None):
+        """
+        Fetch driveItem metadata for a drive-relative path. Uses the cached item id when it's
+        fresh; falls back to path resolution if the id has gone stale (file replaced/moved).
+        """
+        params = {"$select": select} if select else None
+        item_id = self._cached_item_id(drive_id, path)
+        if item_id:
+            response = self.get(f"drives/{drive_id}/items/{item_id}", params=params)
+            if response.status_code != 404:
+                response.raise_for_status()
+                return response.json()
+            self.forget_item(drive_id, path)
+
+        if params and "id" not in select.split(","):
+            params["$select"] = f"id,{select}"
+        item = self.get_json(f"drives/{drive_id}/root:/{quote(path.strip('/'))}", params=params)
+        self._remember_item(drive_id, path, item["id"])
+        return item
+
+    def item_id(self, drive_id, path):
+        return self._cached_item_id(drive_id, path) or self.item(drive_id, path, select="id")["id"]
+
+    def download(self, drive_id, path):
+        """Download a file's bytes by drive-relative path"""
+        response = self.get(f"drives/{drive_id}/items/{self.item_id(drive_id, path)}/content")
+        if response.status_code == 404:
+            self.forget_item(drive_id, path)
+            response = self.get(f"drives/{drive_id}/items/{self.item_id(drive_id, path)}/content")
+        response.raise_for_status()
+        return response.content
+
+    def forget_item(self, drive_id, path):
+        with self._lock:
+            self._item_ids.pop((drive_id, path.strip("/")), None)
+
+    def _cached_item_id(self, drive_id, path):
+        with self._lock:
+            cached = self._item_ids.get((drive_id, path.strip("/")))
+        if cached and cached[1] > time.time():
+            return cached[0]
+        return None
+
+    def _remember_item(self, drive_id, path, item_id):
+        with self._lock:
+            self._item_ids[(drive_id, path.strip("/"))] = (item_id, time.time() + self.item_ttl)
@@ -1,23 +1,66 @@
 import pandas as pd
+import numpy as np
 import requests
-from flask import Flask, render_template, jsonify
+from flask import (Flask, Response, render_template, jsonify, request, abort, make_response, g,
+                   before_render_template, template_rendered)
+from flask_socketio import SocketIO
 from datetime import datetime
-from io import BytesIO
-from office365.runtime.auth.user_credential import UserCredential
-from office365.sharepoint.client_context import ClientContext
+from io import BytesIO, RawIOBase, StringIO
+import csv
+import gzip
 import sqlite3
+import hashlib
+import base64
 import threading
+import time
 import os
-import psycopg2
-from sqlalchemy import create_engine
-from sqlalchemy.engine.url import make_url
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from sqlalchemy import MetaData, Table, create_engine, event, inspect, make_url, text, types
+from sqlalchemy.pool import QueuePool
+from markupsafe import Markup
 from msal import ConfidentialClientApplication
-from urllib.parse import quote
+from plan_workbook import read_sheet_blocks
+from table_sync import sync_table
+from bulk_load import bulk_load
+from graph_client import GraphClient
+from dashboard_cache import SnapshotCache
+from scheduler import RefreshScheduler, leader_lock, locked_transaction
+from plan_history import compact_history, record_snapshot, run_as_of, snapshot_frame
+from metrics import MetricsRegistry
+from capacity import project_schedule, summarize_schedule, weekly_capacity
+from plan_schema import apply_schema, column_sql_types
+
+try:
+    import brotli  # in requirements.txt; without it pages are served gzip-compressed only
+except ImportError:
+    brotli = None
 
 
 
 app = Flask(__name__)
 
+# Live updates for the shop-floor screens. Set SOCKETIO_MESSAGE_QUEUE (e.g. a Redis URL)
+# when the ingest runs in another process (refresh_data.py, a second worker) so its
+# broadcasts reach the clients connected here. Several gunicorn workers also need sticky
+# sessions at the load balancer: with no websocket server in requirements.txt, clients use
+# long-polling, and every poll must reach the worker that holds its session.
+socketio = SocketIO(app, message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE"))
+
+# LOG_LEVEL=DEBUG brings back the per-load column/row dumps
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="[%(asctime)s] %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger("dashboard")
+
+# --- 📈 Metrics (Prometheus text format at /metrics) ---
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram("dashboard_request_seconds", "Request latency by route, method and status")
+stage_seconds = metrics.histogram("dashboard_stage_seconds", "Ingest stage durations (download, parse, write) by source")
+render_seconds = metrics.histogram("dashboard_template_render_seconds", "Template rendering time by template")
+query_seconds = metrics.histogram("dashboard_db_query_seconds", "DB statement time by statement verb")
+ingest_runs_total = metrics.counter("dashboard_ingest_runs_total", "Ingest attempts by source and status")
+ingest_rows_total = metrics.counter("dashboard_ingest_rows_total", "Rows loaded by table (inserted + updated + unchanged)")
+ingest_bytes_total = metrics.counter("dashboard_ingest_downloaded_bytes_total", "Workbook bytes downloaded from Graph by source")
+
 # SharePoint authentication details
 site_url = "https://donite1.sharepoint.com/sites/Donite"
 
@@ -31,118 +74,229 @@ file_url = "Quality/01-QMS/Records/DONITE Production Approvals/PPAR/KPI Plan vs
 
 
 
-msal_app = ConfidentialClientApplication(
-    client_id,
-    authority=f"https://login.microsoftonline.com/{tenant_id}",
-    client_credential=client_secret
-)
-
 SCOPES = ["https://graph.microsoft.com/.default"]
 
-def get_access_token():
+# Everything that touches the network or the DB is created on first use, so
+# importing this module (gunicorn workers, refresh_data.py) costs nothing
+_init_lock = threading.Lock()
+_msal_app = None
+_site_and_drive = None
+_engine = None
+
+def get_msal_app():
+    # MSAL does authority discovery over HTTP when constructed
+    global _msal_app
+    with _init_lock:
+        if _msal_app is None:
+            _msal_app = ConfidentialClientApplication(
+                client_id,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                client_credential=client_secret
+            )
+    return _msal_app
+
+def acquire_token():
+    msal_app = get_msal_app()
     result = msal_app.acquire_token_silent(scopes=SCOPES, account=None)
     if not result:
         result = msal_app.acquire_token_for_client(scopes=SCOPES)
-    if "access_token" not in result:
-        raise Exception(f"Unable to acquire token: {result.get('error_description')}")
-    return result["access_token"]
+    return result
+
+# One pooled session + token/item-id cache for every Graph call
+graph = GraphClient(acquire_token)
+
+def get_access_token():
+    return graph.token()
+
+def get_data_version():
+    """Changes whenever an ingest commits new data (content hashes in ingest_state)"""
+    try:
+        with get_engine().connect() as conn:
+            return tuple(tuple(row) for row in conn.execute(text("SELECT source, content_hash FROM ingest_state ORDER BY source")))
+    except Exception:
+        return None
+
+# Prepared dashboard data, reused until the next ingest
+snapshot_cache = SnapshotCache(get_data_version)
+
+def precompress(html):
+    """{content coding: body} for a rendered page, compressed once when it's cached rather than per response"""
+    body = html.encode("utf-8")
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=9)
+    return bodies
+
+def precompressed_response(bodies):
+    """The smallest precompressed body the client accepts (Accept-Encoding), as a text/html response"""
+    encoding = next((coding for coding in ("br", "gzip") if coding in bodies and request.accept_encodings[coding]),
+                    "identity")
+    response = Response(bodies[encoding], mimetype="text/html")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
 
 def get_headers():
-    return {"Authorization": f"Bearer {get_access_token()}"}
+    return graph.headers()
 
 def fetch_site_and_drive():
     # Use the site identifier format: hostname:/site-path
     site_identifier = "donite1.sharepoint.com:/sites/Donite"
 
     # Site ID
-    response = requests.get(f"https://graph.microsoft.com/v1.0/sites/{site_identifier}", headers=get_headers())
-    response.raise_for_status()
-    site_id = response.json()["id"]
+    site_id = graph.get_json(f"sites/{site_identifier}")["id"]
 
     # Drive ID
-    response = requests.get(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives", headers=get_headers())
-    response.raise_for_status()
-    drives = response.json().get("value", [])
+    drives = graph.get_json(f"sites/{site_id}/drives").get("value", [])
     drive_id = next((d["id"] for d in drives if d["name"] in ["Documents", "Shared Documents"]), None)
     if not drive_id:
         raise Exception("Could not find desired drive")
     return site_id, drive_id
-site_id, drive_id = fetch_site_and_drive()
+
+def get_site_and_drive():
+    """(site_id, drive_id), looked up once on first use"""
+    global _site_and_drive
+    with _init_lock:
+        if _site_and_drive is None:
+            _site_and_drive = fetch_site_and_drive()
+    return _site_and_drive
 
 # === Download file from SharePoint ===
-def download_excel_from_sharepoint():
-    token = get_access_token()
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # Locate file (Graph path method)
-    item_resp = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{file_url}",
-        headers=headers
-    )
-    item_resp.raise_for_status()
-    item_id = item_resp.json()["id"]
+def download_excel_from_sharepoint(known_version=None):
+    """
+    Download the utilisation workbook.
+    :param known_version: Version recorded by the last ingest; the download is skipped if it still matches.
+    :return: (BytesIO, version), or (None, version) when the file is unchanged.
+    """
+    site_id, drive_id = get_site_and_drive()
 
-    # Download content
-    file_resp = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/content",
-        headers=headers
-    )
-    file_resp.raise_for_status()
+    # Locate file (cached item id) and read its version
+    item = graph.item(drive_id, file_url, select=item_version_fields)
+    version = item_version(item)
+    if known_version and version == known_version:
+        return None, version
 
-    return BytesIO(file_resp.content)
+    # Download content
+    return BytesIO(graph.download(drive_id, file_url)), version
 
 # === Process Excel & Update DB ===
-def update_machine_utilization(engine):
-    excel_bytes = download_excel_from_sharepoint()
-
+# The ingest is split into phases so ingest() can overlap them: fetch (network, thread pool),
+# parse (CPU, process pool) and write (DB, serialized). Parse functions take bytes and return
+# frames so they can run in a worker process.
+def fetch_utilization_workbook(state):
+    """Fetch phase: (bytes, version), or (None, version) when the recorded version still matches"""
+    excel_bytes, version = download_excel_from_sharepoint(state["version"] if state else None)
+    return (excel_bytes.getvalue() if excel_bytes is not None else None), version
+
+def normalize_booking_weeks(values):
+    """
+    Vectorized BookingWeek parsing. Week numbers (5, 5.0, " 5.0 ") are kept as they are; dates
+    (datetime cells or date strings) become their ISO week *and* ISO year, so the same week number
+    in two years stays two rows. Parsing is done once per distinct value, not per row.
+    :return: DataFrame aligned with `values`: "Year" (ISO year, <NA> for bare week numbers), "Week",
+             and the "BookingWeek" label ("Week 5" / "Week 5 (2025)"); all <NA> where unparseable.
+    """
+    values = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    weeks = pd.DataFrame({"Year": pd.array([pd.NA] * len(uniques), dtype="Int64"),
+                          "Week": pd.array([pd.NA] * len(uniques), dtype="Int64")})
+
+    text_values = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    numeric = text_values.str.fullmatch(r"\d+\.?\d*|\.\d+").to_numpy(dtype=bool)
+    numbers = text_values[numeric].astype(float)
+    weeks.loc[numeric, "Week"] = np.trunc(numbers).where(numbers < 2 ** 63).astype("Int64").to_numpy()
+
+    others = uniques[~numeric]
+    if len(others):
+        try:
+            dates = pd.to_datetime(pd.Index(others, dtype=object), format="mixed", errors="coerce")
+        except (TypeError, ValueError, OverflowError):
+            # Odd mixes (numbers alongside strings) that the batch parser rejects
+            dates = pd.DatetimeIndex([pd.to_datetime(v, errors="coerce") for v in others])
+        iso = dates.isocalendar()
+        weeks.loc[~numeric, "Year"] = iso["year"].to_numpy()
+        weeks.loc[~numeric, "Week"] = iso["week"].to_numpy()
+
+    labels = "Week " + weeks["Week"].astype("string") + (" (" + weeks["Year"].astype("string") + ")").fillna("")
+    weeks["BookingWeek"] = labels.astype(object).where(weeks["Week"].notna(), None)
+    # Map the per-distinct-value results back onto the rows (code -1 = missing value)
+    rows = weeks.reindex(codes).set_axis(values.index)
+    rows["BookingWeek"] = rows["BookingWeek"].where(rows["Week"].notna(), None)
+    return rows
+
+utilization_machines = ["VAC_NO.1", "VAC_NO.2", "VAC_NO.3", "VAC_NO.5", "VAC_NO.6", "VAC_NO.7"]
+
+def parse_utilization_workbook(content):
+    """Parse phase: workbook bytes → weekly Plan/Actual/Percent per machine"""
     # Read sheet
-    df = pd.read_excel(excel_bytes, sheet_name="Machine Utilisation_PVT", header=37)
+    df = pd.read_excel(BytesIO(content), sheet_name="Machine Utilisation_PVT", header=37)
     df = df[["BookingWeek", "ResourceCode", "Max of AvailableHoursPerWeek", "Sum of Total actual time_Hrs"]]
 
 
     # Drop rows with NaN BookingWeek/ResourceCode
     df = df.dropna(subset=["BookingWeek", "ResourceCode"])
 
-    # --- Fix: properly indented helper function ---
-    def format_week(val):
-        try:
-            if pd.isna(val):
-                return None
-            val_str = str(val).strip()
-        # numeric week
-            if val_str.isdigit() or ('.' in val_str and val_str.replace('.', '', 1).isdigit()):
-                return f"Week {int(float(val_str))}"
-        # try datetime
-            dt = pd.to_datetime(val, errors='coerce')
-            if not pd.isna(dt):
-                return f"Week {dt.isocalendar().week}"
-            return None
-        except:
-            return None
-
-    df["BookingWeek"] = df["BookingWeek"].apply(format_week)
+    weeks = normalize_booking_weeks(df["BookingWeek"])
+    df = df.assign(BookingWeek=weeks["BookingWeek"], BookingYear=weeks["Year"], WeekNumber=weeks["Week"])
     df = df.dropna(subset=["BookingWeek"])  # drop rows where week couldn't be parsed
 
-
-
     # Filter machines of interest
-    machines = ["VAC_NO.1", "VAC_NO.2", "VAC_NO.3", "VAC_NO.5", "VAC_NO.6", "VAC_NO.7"]
-    df = df[df["ResourceCode"].isin(machines)]
+    df = df[df["ResourceCode"].isin(utilization_machines)]
 
     # Aggregate
     agg_df = df.groupby(["BookingWeek", "ResourceCode"]).agg(
+        BookingYear=("BookingYear", "first"),
+        WeekNumber=("WeekNumber", "first"),
         Plan=("Max of AvailableHoursPerWeek", "first"),
         Actual=("Sum of Total actual time_Hrs", "first")
     ).reset_index()
 
     # Compute %
     agg_df["Percent"] = (agg_df["Actual"] / agg_df["Plan"] * 100).round(2)
-
-    # Push to DB
-    agg_df.to_sql("machine_utilization", engine, if_exists="replace", index=False)
-
     return agg_df
 
+def build_utilization_view(agg_df):
+    """
+    The /MU table, pivoted once at ingest: one row per week in (ISO year, week) order with
+    Plan/Actual/Percent and an Over flag (Percent > 100) per machine, in utilization_machines order.
+    """
+    metrics = ["Plan", "Actual", "Percent"]
+    pivot = agg_df.pivot_table(index="BookingWeek", columns="ResourceCode", values=metrics,
+                               aggfunc="first", fill_value=0)
+    # A machine with no rows at all keeps empty (NULL) cells
+    pivot = pivot.reindex(columns=pd.MultiIndex.from_product([metrics, utilization_machines])).round(2)
+
+    view = pd.DataFrame({"BookingWeek": pivot.index})
+    for machine in utilization_machines:
+        for metric in metrics:
+            view[f"{machine}_{metric}"] = pivot[metric, machine].to_numpy()
+        view[f"{machine}_Over"] = (pivot["Percent", machine] > 100).to_numpy()
+
+    # Sort by ISO year, then week (bare week numbers, with no year, first)
+    weeks = agg_df.drop_duplicates("BookingWeek").set_index("BookingWeek")[["BookingYear", "WeekNumber"]]
+    view = view.join(weeks, on="BookingWeek").sort_values(["BookingYear", "WeekNumber"], na_position="first")
+    view = view.drop(columns=["BookingYear", "WeekNumber"])
+    view.insert(0, "position", range(len(view)))
+    return view
+
+def write_utilization_table(conn, agg_df, version=None):
+    """Write phase: returns (changed live keys, row counts)"""
+    bulk_load(conn, "machine_utilization", agg_df, if_exists="replace")
+    view = build_utilization_view(agg_df)
+    bulk_load(conn, "machine_utilization_view", view, if_exists="replace")
+    # Machine pages project finish dates from these hours, so their screens refresh too
+    codes = set(agg_df["ResourceCode"])
+    changed = {"utilization"} | {machine_slug_from_name(name) for name, code in machine_map.items() if code in codes}
+    return changed, {"machine_utilization": {"rows": len(agg_df)},
+                             "machine_utilization_view": {"rows": len(view)}}
+
+def update_machine_utilization(engine=None, force=False):
+    """Returns the aggregated frame, or None when the workbook hasn't changed since the last ingest (unless force)"""
+    report, results = run_ingest(["utilization"], force=force, parallel=False, engine=engine)
+    if report["sources"]["utilization"]["status"] == "error":
+        raise Exception(report["sources"]["utilization"]["error"])
+    return results.get("utilization")
 
 def refresh_excel_workbook(file_url, max_wait=600, poll_interval=15):
     """
@@ -152,56 +306,51 @@ def refresh_excel_workbook(file_url, max_wait=600, poll_interval=15):
     :param max_wait: Max seconds to wait for refresh completion (default 10 minutes).
     :param poll_interval: Seconds between polling attempts.
     """
-    token = get_access_token()
-    headers = {"Authorization": f"Bearer {token}"}
+    site_id, drive_id = get_site_and_drive()
 
-    # --- 1️⃣ Get the file item ID ---
-    item_resp = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{file_url}",
-        headers=headers
-    )
-    item_resp.raise_for_status()
-    item_id = item_resp.json()["id"]
+    # --- 1️⃣ Get the file item ID (cached) ---
+    item_id = graph.item_id(drive_id, file_url)
+    workbook_url = f"sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook"
 
     # --- 2️⃣ Start a workbook session ---
-    session_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook/createSession"
+    session_url = f"{workbook_url}/createSession"
     session_payload = {"persistChanges": True}
-    session_resp = requests.post(session_url, headers={**headers, "Content-Type": "application/json"}, json=session_payload)
+    session_resp = graph.post(session_url, headers={"Content-Type": "application/json"}, json=session_payload)
     session_resp.raise_for_status()
     session_id = session_resp.json()["id"]
-    session_headers = {**headers, "workbook-session-id": session_id}
+    session_headers = {"workbook-session-id": session_id}
 
-    print("🔄 Triggering Excel refreshAll for:", file_url)
+    log.info("🔄 Triggering Excel refreshAll for: %s", file_url)
     # --- Try refreshAll (for connected workbooks); fallback to refreshSession ---
-    refresh_all_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook/refreshAll"
-    refresh_session_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook/refreshSession"
+    refresh_all_url = f"{workbook_url}/refreshAll"
+    refresh_session_url = f"{workbook_url}/refreshSession"
 
-    print("🔄 Attempting to refresh workbook:", file_url)
-    refresh_resp = requests.post(refresh_all_url, headers=session_headers)
+    log.info("🔄 Attempting to refresh workbook: %s", file_url)
+    refresh_resp = graph.post(refresh_all_url, headers=session_headers)
 
     # If refreshAll is unsupported, fallback gracefully
     if refresh_resp.status_code == 404 or "Resource not found" in refresh_resp.text:
-        print("⚠️ refreshAll not supported — trying refreshSession instead.")
-        refresh_resp = requests.post(refresh_session_url, headers=session_headers)
+        log.warning("⚠️ refreshAll not supported — trying refreshSession instead.")
+        refresh_resp = graph.post(refresh_session_url, headers=session_headers)
 
     if refresh_resp.status_code not in (200, 202):
         raise Exception(f"❌ Workbook refresh failed to start: {refresh_resp.text}")
 
 
-    print("✅ Refresh triggered, waiting for completion...")
+    log.info("✅ Refresh triggered, waiting for completion...")
 
     # --- 3️⃣ Poll until refresh completes ---
-    status_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook/operations"
+    status_url = f"{workbook_url}/operations"
     start_time = time.time()
 
     while True:
-        status_resp = requests.get(status_url, headers=session_headers)
+        status_resp = graph.get(status_url, headers=session_headers)
         status_resp.raise_for_status()
         operations = status_resp.json().get("value", [])
 
         active_ops = [op for op in operations if op["status"] in ["running", "inProgress"]]
         if not active_ops:
-            print("✅ Workbook refresh completed successfully.")
+            log.info("✅ Workbook refresh completed successfully.")
             break
 
         if time.time() - start_time > max_wait:
@@ -209,81 +358,87 @@ def refresh_excel_workbook(file_url, max_wait=600, poll_interval=15):
         time.sleep(poll_interval)
 
     # --- 4️⃣ Close session ---
-    close_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{item_id}/workbook/closeSession"
-    requests.post(close_url, headers=session_headers)
+    close_url = f"{workbook_url}/closeSession"
+    graph.post(close_url, headers=session_headers)
 
 
+@snapshot_cache.cached("utilization_view")
+def get_utilization_view():
+    """Rows of the precomputed /MU table (see build_utilization_view)"""
+    query = text('SELECT * FROM machine_utilization_view ORDER BY position')
+    conn = get_db_connection()
+    try:
+        rows = [dict(row) for row in conn.execute(query).mappings()]
+    except Exception:
+        rows = []
+        conn.rollback()
+    finally:
+        conn.close()
+    if not rows:
+        # Empty, or not built yet (tables loaded before the view existed)
+        log.info("Table empty, updating...")
+        update_machine_utilization(force=True)
+        conn = get_db_connection()
+        try:
+            rows = [dict(row) for row in conn.execute(query).mappings()]
+        finally:
+            conn.close()
+    return rows
+
 @app.route("/MU")
 def mu():
     try:
-        query = 'SELECT * FROM machine_utilization ORDER BY "BookingWeek", "ResourceCode"'
-        df = pd.read_sql(query, engine)
-        if df.empty:
-            print(f"[{datetime.now()}] Table empty, updating...")
-            df = update_machine_utilization(engine)
+        weeks = get_utilization_view()
     except Exception as e:
-        import traceback
-        print(f"[{datetime.now()}] Error fetching machine utilization: {e}")
-        traceback.print_exc()
+        log.exception("Error fetching machine utilization: %s", e)
         return "Error fetching machine utilization. Check server logs.", 500
 
-    machines = ["VAC_NO.1", "VAC_NO.2", "VAC_NO.3", "VAC_NO.5", "VAC_NO.6", "VAC_NO.7"]
-
-    # Pivot table
-    pivot = df.pivot_table(
-        index="BookingWeek",
-        columns="ResourceCode",
-        values=["Plan", "Actual", "Percent"],
-        aggfunc='first',
-        fill_value=0
-    )
-
-    # Flatten columns
-    pivot.columns = [f"{col[1]}_{col[0]}" for col in pivot.columns]
-    pivot.reset_index(inplace=True)
-
-    # Add numeric week for sorting
-    pivot['WeekNumber'] = pivot['BookingWeek'].str.extract(r'(\d+)').astype(int)
-    pivot = pivot.sort_values('WeekNumber')
-
-    # Round numeric columns
-    for col in pivot.columns:
-        if any(sub in col for sub in ['Plan', 'Actual', 'Percent']):
-            pivot[col] = pivot[col].round(2)
-
-    # Build HTML
-    table_html = ""
-    for _, row in pivot.iterrows():
-        table_html += f"<tr><td>{row['BookingWeek']}</td>"
-        for machine in machines:
-            plan = row.get(f"{machine}_Plan", "")
-            actual = row.get(f"{machine}_Actual", "")
-            percent = row.get(f"{machine}_Percent", "")
-            # Highlight if > 100
-            if percent != "" and float(percent) > 100:
-                percent_html = f'<span class="over-100">{percent}</span>'
-            else:
-                percent_html = percent
-            table_html += f"<td>{plan}</td><td>{actual}</td><td>{percent_html}</td>"
+    return render_template("Machine Utilization.html", machines=utilization_machines, weeks=weeks)
+
 
-        table_html += "</tr>"
 
-    return render_template("Machine Utilization.html", tables=table_html)
 
 
 
+# --- 🔁 Change detection (skip the ingest when the workbook hasn't changed) ---
+item_version_fields = "id,eTag,cTag,lastModifiedDateTime"
 
+def item_version(item):
+    """cTag only changes when the file content does; fall back to eTag / lastModified"""
+    return item.get("cTag") or item.get("eTag") or item.get("lastModifiedDateTime")
 
+def get_sharepoint_item(drive_path):
+    """Fetch just the driveItem metadata (no content)"""
+    site_id, drive_id = get_site_and_drive()
+    return graph.item(drive_id, drive_path, select=item_version_fields)
+
+def get_ingest_state(source):
+    """Version/content hash recorded by the last successful ingest of `source`, or None"""
+    with get_engine().begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS ingest_state "
+            "(source TEXT PRIMARY KEY, version TEXT, content_hash TEXT, updated_at TIMESTAMP)"
+        ))
+        row = conn.execute(text("SELECT version, content_hash FROM ingest_state WHERE source = :source"),
+                           {"source": source}).mappings().first()
+    return dict(row) if row else None
+
+def save_ingest_state(conn, source, version, content_hash):
+    """Call inside the same transaction as the data writes, so a failed load is retried next time"""
+    conn.execute(text("DELETE FROM ingest_state WHERE source = :source"), {"source": source})
+    conn.execute(text("INSERT INTO ingest_state (source, version, content_hash, updated_at) "
+                      "VALUES (:source, :version, :content_hash, :updated_at)"),
+                 {"source": source, "version": version, "content_hash": content_hash,
+                  "updated_at": datetime.now()})
 
 # --- 📂 File Download (like Program 1) ---
 def download_sharepoint_file(drive_path):
     """Download file using Graph API like Program 1"""
-    download_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:{quote(drive_path)}:/content"
-    response = requests.get(download_url, headers=get_headers())
-    if response.status_code == 200:
-        return BytesIO(response.content)
-    else:
-        raise Exception(f"Failed to download file: {response.status_code}, {response.text}")
+    site_id, drive_id = get_site_and_drive()
+    try:
+        return BytesIO(graph.download(drive_id, drive_path))
+    except requests.HTTPError as e:
+        raise Exception(f"Failed to download file: {e.response.status_code}, {e.response.text}")
 
 # Excel read parameters
 sheet_name_pvt = "PVT - Planned Start Date"
@@ -342,141 +497,213 @@ column_rename_map_stores_goods_in = {
 
 
 # --- Local Testing (SQLite) ---
-# Uncomment for local testing:
-#DATABASE_URLL = "sqlite:///local.db"
-#engine = create_engine(DATABASE_URLL)
-
-#def get_db_connection():
-    #if DATABASE_URLL.startswith("sqlite"):
-        #return sqlite3.connect("local.db")
-    #else:
-        #return psycopg2.connect(DATABASE_URLL, sslmode="require")
+# Point the same variable at SQLite, e.g. production-data-db=sqlite:///local.db
 
 bank = os.getenv("production-data-db")  # Set this in Render as an environment variable  # same var
-engine = create_engine(bank)
-update_machine_utilization(engine)
 
-# For psycopg2
+# One bounded, thread-safe pool (SQLAlchemy QueuePool) shared by every route and the ingest
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+db_pool_timeout = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _pool_options(url):
+    """Pool sizing for a QueuePool; other pool classes (e.g. in-memory SQLite's SingletonThreadPool) reject it"""
+    url = make_url(url)
+    if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return {}
+    return {"pool_size": db_pool_size, "max_overflow": db_max_overflow, "pool_timeout": db_pool_timeout}
+
+def get_engine():
+    global _engine
+    with _init_lock:
+        if _engine is None:
+            _engine = create_engine(
+                bank,
+                pool_recycle=db_pool_recycle,
+                pool_pre_ping=True,  # health-check connections on checkout
+                **_pool_options(bank),
+            )
+            event.listen(_engine, "before_cursor_execute", _query_started)
+            event.listen(_engine, "after_cursor_execute", _query_finished)
+    return _engine
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, which is discarded with it whether or not it raises
+    context._query_started = time.perf_counter()
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    # Labelled by verb only (SELECT, INSERT, ...) so the series count stays bounded
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    query_seconds.observe(time.perf_counter() - started, statement=verb)
+
+_pool_lock = threading.Lock()
+pool_metrics = {"checkouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
 def get_db_connection():
-    url = make_url(bank)
-    return psycopg2.connect(
-        dbname=url.database,
-        user=url.username,
-        password=url.password,
-        host=url.host,
-        port=url.port
-    )
-
-def get_stores_data():
+    """Pooled SQLAlchemy connection; close() hands it back to the pool"""
+    started = time.perf_counter()
+    conn = get_engine().connect()
+    waited = time.perf_counter() - started
+    with _pool_lock:
+        pool_metrics["checkouts"] += 1
+        pool_metrics["wait_seconds_total"] += waited
+        pool_metrics["wait_seconds_max"] = max(pool_metrics["wait_seconds_max"], waited)
+    return conn
+
+def pool_stats():
+    pool = get_engine().pool
+    with _pool_lock:
+        stats = dict(pool_metrics)
+    for name in ("size", "checkedout", "overflow"):
+        # QueuePool's counters are methods; SingletonThreadPool has a plain `size` setting instead
+        if callable(getattr(pool, name, None)):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+def read_plan_table(conn, table, as_of=None, machine_key=None):
+    """
+    The live `table`, or (with `as_of`, a datetime) the rows the latest ingest run at or
+    before that moment loaded, from the snapshot history. None if no run is that old.
+    Either way the columns come back as plan_schema declares them.
+    """
+    if as_of is None:
+        # apply_schema parses SQLite's DATETIME text column-at-a-time; PostgreSQL rows arrive typed
+        if machine_key is None:
+            return apply_schema(pd.read_sql_query(f"SELECT * FROM {table}", conn))
+        query = text(f'SELECT * FROM {table} WHERE machine_key = :machine_key')
+        return apply_schema(pd.read_sql_query(query, conn, params={"machine_key": machine_key}))
+    run_id = run_as_of(conn, as_of)
+    if run_id is None:
+        return None
+    return apply_schema(snapshot_frame(conn, table, run_id, machine_key, parse_dates=["startdate", "finishdate"]))
+
+def request_as_of():
+    """
+    ?as_of=YYYY-MM-DD[THH:MM[:SS]] as a datetime (a bare date means the end of that day), or None.
+    Aborts with 400 on anything else.
+    """
+    value = request.args.get("as_of")
+    if not value:
+        return None
+    try:
+        as_of = datetime.fromisoformat(value)
+    except ValueError:
+        abort(make_response(jsonify({"error": "'as_of' must be YYYY-MM-DD or YYYY-MM-DDTHH:MM"}), 400))
+    if len(value) == 10:
+        as_of = as_of.replace(hour=23, minute=59, second=59)
+    return as_of
+
+def summarize_work_orders(df, date_col="startdate", date_key="start_date", today=None):
+    """
+    Turn a cleaned, sorted work-order frame into the dashboard dict (totals + work_orders),
+    column at a time rather than row by row. `date_col` is the (datetime) column that
+    decides today vs backlog (`today` defaults to the current date); it's shown under
+    `date_key` as DD-MM-YY.
+    """
+    today = today or datetime.today().date()
+    dates = df[date_col]
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    is_today = (dates.dt.normalize() == pd.Timestamp(today)).to_numpy()
+
+    # strftime only the distinct dates; NaT gets code -1, i.e. the trailing ""
+    codes, unique_dates = pd.factorize(dates)
+    labels = np.append(np.asarray(unique_dates.strftime("%d-%m-%y"), dtype=object), "")
+
+    keys = [date_key, "work_order_number", "part_number", "total_hours_required",
+            "parts_qty", "wo_status", "printing_status", "is_backlog"]
+    columns = [
+        labels[codes].tolist(),
+        df["worksordernumber"].tolist(),
+        df["partnumber"].tolist(),
+        df["totalhours"].tolist(),
+        df["partsqty"].tolist(),
+        df["wo status"].tolist(),
+        df["printing status"].tolist() if "printing status" in df.columns else ["Not Printed"] * len(df),
+        (~is_today).tolist(),
+    ]
+
+    total_work_orders = df.shape[0]
+    total_today = int(is_today.sum())
+    return {
+        "total_work_orders": total_work_orders,
+        "total_today": total_today,
+        "total_backlog": total_work_orders - total_today,
+        "work_orders": [dict(zip(keys, values)) for values in zip(*columns)]
+    }
+
+@snapshot_cache.cached("stores", bypass_arg="as_of")
+def get_stores_data(as_of=None):
     try:
         conn = get_db_connection()
-        df_stores = pd.read_sql_query("SELECT * FROM stores_data", conn)
-        conn.close()
+        try:
+            df_stores = read_plan_table(conn, "stores_data", as_of)
+        finally:
+            conn.close()
+        if df_stores is None:
+            return None
 
-        print(f"Columns in stores_data: {df_stores.columns.tolist()}")  # Debug column names
-        print(f"First few rows:\n{df_stores.head()}")  # Debug data
+        log.debug("Columns in stores_data: %s", df_stores.columns.tolist())
+        log.debug("First few rows:\n%s", df_stores.head())
 
         # Data cleaning
         relevant_cols = ["startdate", "worksordernumber", "partnumber", "totalhours", "partsqty", "wo status"]
         df_stores.dropna(subset=relevant_cols, how='all', inplace=True)
 
-        df_stores["startdate"] = pd.to_datetime(df_stores["startdate"], errors="coerce")
-        df_stores["totalhours"] = pd.to_numeric(df_stores["totalhours"], errors="coerce").fillna(0)
-        df_stores["partsqty"] = pd.to_numeric(df_stores["partsqty"], errors="coerce").fillna(0)
+        df_stores["totalhours"] = df_stores["totalhours"].fillna(0)
+        df_stores["partsqty"] = df_stores["partsqty"].fillna(0)
         df_stores = df_stores.sort_values(by="startdate", ascending=False)
 
-        today = datetime.today().date()
-        total_work_orders = df_stores.shape[0]
-        total_today = df_stores[df_stores["startdate"].dt.date == today].shape[0]
-        total_backlog = total_work_orders - total_today
-
-        work_orders = []
-        for _, row in df_stores.iterrows():
-            start_date = row["startdate"].date() if pd.notnull(row["startdate"]) else None
-            is_backlog = start_date != today
-
-            work_orders.append({
-                "start_date": row["startdate"].strftime("%d-%m-%y") if pd.notnull(row["startdate"]) else "",
-                "work_order_number": row["worksordernumber"],
-                "part_number": row["partnumber"],
-                "total_hours_required": row["totalhours"],
-                "parts_qty": row["partsqty"],
-                "wo_status": row["wo status"],
-                "printing_status": row.get("printing status", "Not Printed"),
-                "is_backlog": is_backlog
-            })
-
-        return {
-            "total_work_orders": total_work_orders,
-            "total_today": total_today,
-            "total_backlog": total_backlog,
-            "work_orders": work_orders
-        }
+        data = summarize_work_orders(df_stores, today=as_of and as_of.date())
+        return summary_header(data, "stores") if as_of is None else data
 
     except Exception as e:
-        print(f"[{datetime.now()}] Error fetching stores data: {e}")
+        log.error("Error fetching stores data: %s", e)
         return None
 
-def get_stores_goods_in_data():
+@snapshot_cache.cached("stores_goods_in", bypass_arg="as_of")
+def get_stores_goods_in_data(as_of=None):
     try:
         conn = get_db_connection()
-        df_stores_goods_in = pd.read_sql_query("SELECT * FROM stores_goods_in_data", conn)
-        conn.close()
+        try:
+            df_stores_goods_in = read_plan_table(conn, "stores_goods_in_data", as_of)
+        finally:
+            conn.close()
+        if df_stores_goods_in is None:
+            return None
 
-        print(f"Columns in stores_goods_in_data: {df_stores_goods_in.columns.tolist()}")  # Debug column names
-        print(f"First few rows:\n{df_stores_goods_in.head()}")  # Debug data
+        log.debug("Columns in stores_goods_in_data: %s", df_stores_goods_in.columns.tolist())
+        log.debug("First few rows:\n%s", df_stores_goods_in.head())
 
         # Data cleaning
         relevant_cols = ["finishdate", "worksordernumber", "partnumber", "totalhours", "partsqty", "wo status"]
         df_stores_goods_in.dropna(subset=relevant_cols, how='all', inplace=True)
 
-        df_stores_goods_in["finishdate"] = pd.to_datetime(df_stores_goods_in["finishdate"], errors="coerce")
-        df_stores_goods_in["totalhours"] = pd.to_numeric(df_stores_goods_in["totalhours"], errors="coerce").fillna(0)
-        df_stores_goods_in["partsqty"] = pd.to_numeric(df_stores_goods_in["partsqty"], errors="coerce").fillna(0)
+        df_stores_goods_in["totalhours"] = df_stores_goods_in["totalhours"].fillna(0)
+        df_stores_goods_in["partsqty"] = df_stores_goods_in["partsqty"].fillna(0)
         df_stores = df_stores_goods_in.sort_values(by="finishdate", ascending=False)
 
-        today = datetime.today().date()
-        total_work_orders = df_stores.shape[0]
-        total_today = df_stores[df_stores["finishdate"].dt.date == today].shape[0]
-        total_backlog = total_work_orders - total_today
-
-        work_orders = []
-        for _, row in df_stores.iterrows():
-            start_date = row["finishdate"].date() if pd.notnull(row["finishdate"]) else None
-            is_backlog = start_date != today
-
-            work_orders.append({
-                "finish_date": row["finishdate"].strftime("%d-%m-%y") if pd.notnull(row["finishdate"]) else "",
-                "work_order_number": row["worksordernumber"],
-                "part_number": row["partnumber"],
-                "total_hours_required": row["totalhours"],
-                "parts_qty": row["partsqty"],
-                "wo_status": row["wo status"],
-                "printing_status": row.get("printing status", "Not Printed"),
-                "is_backlog": is_backlog
-            })
-
-        return {
-            "total_work_orders": total_work_orders,
-            "total_today": total_today,
-            "total_backlog": total_backlog,
-            "work_orders": work_orders
-        }
+        data = summarize_work_orders(df_stores, "finishdate", "finish_date", today=as_of and as_of.date())
+        return summary_header(data, "stores_goods_in") if as_of is None else data
 
     except Exception as e:
-        print(f"[{datetime.now()}] Error fetching stores data: {e}")
+        log.error("Error fetching stores data: %s", e)
         return None
 
 @app.route("/stores")
 def stores_dashboard():
-    data = get_stores_data()
+    data = get_stores_data(request_as_of())
     if data is None:
         return jsonify({"error": "No data found for Stores"}), 404
     return render_template("stores.html", **data)
 
 @app.route("/stores_goods_in")
 def stores_goods_in_dashboard():
-    data = get_stores_goods_in_data()
+    data = get_stores_goods_in_data(request_as_of())
     if data is None:
         return jsonify({"error": "No data found for Stores"}), 404
     return render_template("stores goods in.html", **data)
@@ -491,99 +718,367 @@ def clean_and_prepare_df(df, rename_map):
     return df
 
 
-def create_db_and_load_excel():
+def machine_key_for(resource):
+    """
+    Slug of the machine whose Excel name appears in the resource description (same
+    case-insensitive substring rule the routes used with ILIKE); the longest name wins,
+    so a resource is never claimed by a machine whose name is a substring of another's.
+    """
+    if not isinstance(resource, str):
+        return None
+    resource = resource.strip().lower()
+    matches = [(len(name), slug) for slug, name in slug_to_excel_name.items() if name.strip().lower() in resource]
+    return max(matches)[1] if matches else None
+
+def add_machine_keys(df):
+    """Add the indexed machine_key column; computed per distinct resource, not per row"""
+    resources = df["resourcedescription"]
+    df["machine_key"] = resources.map({r: machine_key_for(r) for r in resources.dropna().unique()})
+    return df
+
+
+plan_drive_path = "/" + file_url_pvt
+
+# Columns the live plan tables must have for the current code; a database loaded by an older
+# version is reloaded on the next ingest even though the workbook itself hasn't changed
+plan_layout_columns = {"vacuum_data": {"machine_key"}, "trimming_data": {"machine_key"}}
+
+def plan_layout_current():
+    """False when a live plan table is missing or lacks one of plan_layout_columns"""
+    conn = get_db_connection()
     try:
-        drive_path = "/Quality/01-QMS/Records/DONITE Production Approvals/PPAR/Plan vs Actual - Daniel - Copy.xlsx"
-        file_stream = download_sharepoint_file(drive_path)
-
-        # Vacuum data
-        df_vacuum = pd.read_excel(file_stream, sheet_name=sheet_name_pvt, header=header_row,
-                                  usecols=usecols_vacuum, engine="openpyxl")
-        df_vacuum = clean_and_prepare_df(df_vacuum, column_rename_map_vacuum)
-
-        file_stream.seek(0)
-
-        # Trimming data
-        df_trimming = pd.read_excel(file_stream, sheet_name=sheet_name_pvt, header=header_row,
-                                    usecols=usecols_trimming, engine="openpyxl")
-        df_trimming = clean_and_prepare_df(df_trimming, column_rename_map_trimming)
-
-        file_stream.seek(0)
-
-        # Stores data
-        df_stores = pd.read_excel(file_stream, sheet_name=sheet_name_pvt, header=header_row_stores,
-                                  usecols=usecols_stores, engine="openpyxl")
-        df_stores = clean_and_prepare_df(df_stores, column_rename_map_stores)
-
-        # Stores goods in data
-        df_stores_goods_in = pd.read_excel(
-            file_stream,
-            sheet_name=sheet_name_pvt,
-            header=header_row_stores,
-            usecols=usecols_stores_goods_in,
-            engine="openpyxl"
-        )
-        df_stores_goods_in = clean_and_prepare_df(df_stores_goods_in, column_rename_map_stores_goods_in)
-
-        # Save to PostgreSQL
-        df_vacuum.to_sql("vacuum_data", engine, if_exists="replace", index=False, method="multi")
-        df_trimming.to_sql("trimming_data", engine, if_exists="replace", index=False, method="multi")
-        df_stores.to_sql("stores_data", engine, if_exists="replace", index=False, method="multi")
-        df_stores_goods_in.to_sql("stores_goods_in_data", engine, if_exists="replace", index=False, method="multi")
-
-
-        print(f"[{datetime.now()}] Database updated with latest Excel data.")
-    except Exception as e:
-        print(f"[{datetime.now()}] Error updating database: {e}")
+        inspector = inspect(conn)
+        return all(inspector.has_table(table) and columns <= {c["name"] for c in inspector.get_columns(table)}
+                   for table, columns in plan_layout_columns.items())
+    finally:
+        conn.close()
+
+def fetch_plan_workbook(state):
+    """Fetch phase: (bytes, version), or (None, version) when the recorded version still matches"""
+    version = item_version(get_sharepoint_item(plan_drive_path))
+    if state and version and state["version"] == version:
+        return None, version
+    return download_sharepoint_file(plan_drive_path).getvalue(), version
+
+def parse_plan_workbook(content):
+    """Parse phase: workbook bytes → the four cleaned tables, keyed by table name"""
+    # One streamed pass over the sheet, split into the four column blocks
+    frames = read_sheet_blocks(BytesIO(content), sheet_name_pvt, {
+        "vacuum": (usecols_vacuum, header_row),
+        "trimming": (usecols_trimming, header_row),
+        "stores": (usecols_stores, header_row_stores),
+        "stores_goods_in": (usecols_stores_goods_in, header_row_stores),
+    })
+    df_vacuum = clean_and_prepare_df(frames["vacuum"], column_rename_map_vacuum)
+    df_trimming = clean_and_prepare_df(frames["trimming"], column_rename_map_trimming)
+    df_stores = clean_and_prepare_df(frames["stores"], column_rename_map_stores)
+    df_stores_goods_in = clean_and_prepare_df(frames["stores_goods_in"], column_rename_map_stores_goods_in)
+
+    add_machine_keys(df_vacuum)
+    add_machine_keys(df_trimming)
+    # Typed once here (plan_schema), so the DB columns and every reader get dates, ints and categories
+    return {
+        "vacuum_data": apply_schema(df_vacuum),
+        "trimming_data": apply_schema(df_trimming),
+        "stores_data": apply_schema(df_stores),
+        "stores_goods_in_data": apply_schema(df_stores_goods_in),
+    }
 
-def scheduled_refresh(interval_seconds=600):
-    create_db_and_load_excel()
-    threading.Timer(interval_seconds, scheduled_refresh, [interval_seconds]).start()
+def write_plan_tables(conn, frames, version=None):
+    """
+    Write phase: sync only the changed rows of all four tables and append the run to the
+    snapshot history. Returns (changed live keys, row counts)
+    """
+    changed, table_counts = set(), {}
+    for table, keys, live_key in (
+        ("vacuum_data", ["worksordernumber", "resourcedescription"], None),
+        ("trimming_data", ["worksordernumber", "resourcedescription"], None),
+        ("stores_data", ["worksordernumber"], "stores"),
+        ("stores_goods_in_data", ["worksordernumber"], "stores_goods_in"),
+    ):
+        counts = sync_table(conn, table, frames[table], keys, track_column=None if live_key else "machine_key",
+                            dtype=column_sql_types(frames[table].columns))
+        log.info("%s: %d inserted, %d updated, %d deleted, %d unchanged",
+                 table, counts["inserted"], counts["updated"], counts["deleted"], counts["unchanged"])
+        if live_key is None:
+            changed.update(key for key in counts.pop("changed") if key)
+        elif counts["inserted"] or counts["updated"] or counts["deleted"]:
+            changed.add(live_key)
+        table_counts[table] = counts
+    for table in ("vacuum_data", "trimming_data"):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_machine_key ON {table} (machine_key)"))
+    table_counts["machine_summary"] = {"rows": write_machine_summary(conn, frames)}
+    run_id, history_changed = record_snapshot(conn, frames, "plan", version)
+    table_counts["plan_history"] = {"run_id": run_id, "work_orders_changed": history_changed}
+    return changed, table_counts
+
+def create_db_and_load_excel(force=False):
+    """Returns True if the tables were reloaded, False if the workbook was unchanged or the load failed"""
+    report, _ = run_ingest(["plan"], force=force, parallel=False)
+    return report["sources"]["plan"]["status"] == "loaded"
+
+def publish_data_update(changed, tables=None):
+    """
+    Broadcast a compact "data_updated" event to every connected screen:
+    {"version", "changed": [machine slugs / "stores" / "stores_goods_in" / "utilization"],
+     "counts": {slug: work orders}, "tables": {table: row deltas}}
+    """
+    if not changed:
+        return
+    try:
+        counts = get_index_counts()
+        payload = {
+            "version": api_data_fingerprint(),
+            "changed": sorted(changed),
+            "counts": {machine_slug_from_name(name): total for name, total in counts.items()},
+            "tables": tables or {},
+        }
+        socketio.emit("data_updated", payload)
+    except Exception as e:
+        # Screens fall back to their next page load; never fail the ingest over it
+        log.warning("Error broadcasting data update: %s", e)
 
-def get_dashboard_data(resource_name, machine_type):
+# name → (fetch, parse, write); writes run in this order
+ingest_sources = {
+    "plan": (fetch_plan_workbook, parse_plan_workbook, write_plan_tables),
+    "utilization": (fetch_utilization_workbook, parse_utilization_workbook, write_utilization_table),
+}
+# name → check that the live tables match what this code expects (see plan_layout_columns)
+ingest_layout_checks = {"plan": plan_layout_current}
+ingest_parse_processes = int(os.getenv("INGEST_PARSE_PROCESSES", "2"))  # 0 = parse in the download threads
+
+def _fetch_and_check(name, force):
+    """Returns (report entry, content); content is None when the workbook is unchanged"""
+    fetch = ingest_sources[name][0]
+    started = time.perf_counter()
+    state = None if force else get_ingest_state(name)
+    if state and name in ingest_layout_checks and not ingest_layout_checks[name]():
+        log.info("%s tables predate the current layout: reloading", name)
+        state = None
+    content, version = fetch(state)
+    entry = {"version": version, "download_seconds": round(time.perf_counter() - started, 3)}
+    if content is None:
+        entry["status"] = "unchanged"
+        return entry, None
+    entry["content_hash"] = hashlib.sha256(content).hexdigest()
+    entry["bytes"] = len(content)
+    if state and state["content_hash"] == entry["content_hash"]:
+        # Metadata changed but the bytes didn't (e.g. a save with no edits): only the version is recorded
+        entry["status"] = "unchanged"
+        return entry, None
+    return entry, content
+
+def _timed_parse(name, content):
+    started = time.perf_counter()
+    result = ingest_sources[name][1](content)
+    return result, time.perf_counter() - started
+
+def run_ingest(names=None, force=False, parallel=True, engine=None):
+    """
+    Ingest the given sources (default: all of ingest_sources).
+    With parallel=True the downloads overlap on a thread pool and each workbook is parsed in a
+    process pool as soon as it arrives; the DB writes then run one after another.
+    :return: (report, results) — report is JSON-friendly, results maps source → parsed frame(s).
+    """
+    names = list(names or ingest_sources)
+    engine = engine or get_engine()
+    started_at = datetime.now()
+    started = time.perf_counter()
+    report = {"started": started_at.isoformat(timespec="seconds"), "sources": {}}
+    parsed = {}
+
+    def fail(name, e):
+        report["sources"].setdefault(name, {}).update(status="error", error=str(e))
+        log.error("%s ingest failed: %s", name, e)
+
+    def on_parsed(name, result, seconds):
+        parsed[name] = result
+        report["sources"][name]["parse_seconds"] = round(seconds, 3)
+
+    if not parallel:
+        for name in names:
+            try:
+                report["sources"][name], content = _fetch_and_check(name, force)
+                if content is not None:
+                    on_parsed(name, *_timed_parse(name, content))
+            except Exception as e:
+                fail(name, e)
+    else:
+        processes = min(ingest_parse_processes, len(names))
+        parse_pool = ProcessPoolExecutor(processes) if processes else None
+        try:
+            with ThreadPoolExecutor(len(names)) as download_pool:
+                downloads = {download_pool.submit(_fetch_and_check, name, force): name
+                             for name in names}
+                parses = {}
+                for future in as_completed(downloads):
+                    name = downloads[future]
+                    try:
+                        report["sources"][name], content = future.result()
+                    except Exception as e:
+                        fail(name, e)
+                        continue
+                    if content is not None:
+                        pool = parse_pool or download_pool
+                        parses[pool.submit(_timed_parse, name, content)] = name
+                for future in as_completed(parses):
+                    try:
+                        on_parsed(parses[future], *future.result())
+                    except Exception as e:
+                        fail(parses[future], e)
+        finally:
+            if parse_pool:
+                parse_pool.shutdown()
+
+    # Serialized writes: one transaction per source, in ingest_sources order
+    changed, tables = set(), {}
+    for name in names:
+        entry = report["sources"].get(name, {})
+        if entry.get("status") == "error" or (name not in parsed and "content_hash" not in entry):
+            continue  # failed (state left as is, so the next run retries), or the version showed it unchanged
+        try:
+            write_started = time.perf_counter()
+            with locked_transaction(engine, ingest_write_lock, refresh_lock_dir) as conn:
+                if name in parsed:
+                    source_changed, source_tables = ingest_sources[name][2](conn, parsed[name], entry["version"])
+                save_ingest_state(conn, name, entry["version"], entry["content_hash"])
+            if name in parsed:
+                changed |= source_changed
+                tables.update(source_tables)
+                entry.update(status="loaded", tables=source_tables,
+                             write_seconds=round(time.perf_counter() - write_started, 3))
+        except Exception as e:
+            parsed.pop(name, None)
+            fail(name, e)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    for name, entry in report["sources"].items():
+        timings = ", ".join(f"{phase} {entry[f'{phase}_seconds']:.2f}s" for phase in ("download", "parse", "write")
+                            if f"{phase}_seconds" in entry)
+        log.info("Ingest %s: %s (%s) %s", name, entry["status"], entry.get("version"), timings)
+        ingest_runs_total.inc(source=name, status=entry["status"])
+        for phase in ("download", "parse", "write"):
+            if f"{phase}_seconds" in entry:
+                stage_seconds.observe(entry[f"{phase}_seconds"], stage=phase, source=name)
+        if "bytes" in entry:
+            ingest_bytes_total.inc(entry["bytes"], source=name)
+        for table, counts in entry.get("tables", {}).items():
+            if "rows" in counts or "inserted" in counts:
+                ingest_rows_total.inc(counts.get("rows", counts.get("inserted", 0) + counts.get("updated", 0)
+                                                  + counts.get("unchanged", 0)), table=table)
+    log.info("Ingest finished in %.2fs", report["seconds"])
+
+    if parsed:
+        snapshot_cache.bump()
+        publish_data_update(changed, tables)
+    return report, parsed
+
+def ingest(force=False, parallel=True):
+    """
+    Startup/refresh entry point: load the plan workbook and the utilisation workbook.
+    Nothing runs at import time; call this (or refresh_data.py) explicitly.
+    :return: The run report: per source status, version and download/parse/write seconds.
+    """
+    return run_ingest(force=force, parallel=parallel)[0]
+
+# Background refresh: every process may start the scheduler, but only the one holding the
+# leader lock (pg advisory lock, or a file lock on SQLite) actually ingests
+refresh_plan_seconds = int(os.getenv("REFRESH_PLAN_SECONDS", "600"))
+refresh_utilization_seconds = int(os.getenv("REFRESH_UTILIZATION_SECONDS", "1800"))
+refresh_lock_dir = os.getenv("REFRESH_LOCK_DIR")  # file-lock directory when not on PostgreSQL
+# Every write transaction (scheduler, refresh_data.py, /MU's forced reload) runs under this lock,
+# so ingests started outside the leader still never overlap
+ingest_write_lock = "production-data-ingest"
+history_compact_seconds = int(os.getenv("HISTORY_COMPACT_SECONDS", "86400"))
+history_retention_days = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
+history_daily_after_days = int(os.getenv("HISTORY_DAILY_AFTER_DAYS", "7"))  # older runs thinned to one a day
+_scheduler = None
+
+def compact_plan_history():
+    """Retention/compaction of the plan snapshot history (see plan_history.compact_history)"""
+    with locked_transaction(get_engine(), ingest_write_lock, refresh_lock_dir) as conn:
+        return compact_history(conn, history_retention_days, history_daily_after_days)
+
+def scheduled_refresh(plan_seconds=None, utilization_seconds=None):
+    """Start the refresh scheduler for this process (idempotent) and return it"""
+    global _scheduler
+    engine = get_engine()
+    with _init_lock:
+        if _scheduler is None:
+            _scheduler = RefreshScheduler(leader_lock(engine, "production-data-refresh", refresh_lock_dir))
+            _scheduler.add_job("plan", create_db_and_load_excel, plan_seconds or refresh_plan_seconds)
+            _scheduler.add_job("utilization", lambda: update_machine_utilization() is not None,
+                               utilization_seconds or refresh_utilization_seconds)
+            _scheduler.add_job("history-compaction", compact_plan_history, history_compact_seconds)
+            _scheduler.start()
+    return _scheduler
+
+@app.before_request
+def start_scheduler_in_worker():
+    # Under gunicorn there's no __main__; set REFRESH_SCHEDULER=1 to start it on the first request
+    if _scheduler is None and os.getenv("REFRESH_SCHEDULER") == "1":
+        scheduled_refresh()
+
+# Weekly hours for machines with no utilisation figures (trimmers, Red Cannon)
+capacity_default_weekly_hours = float(os.getenv("CAPACITY_DEFAULT_WEEKLY_HOURS", "80"))
+
+@snapshot_cache.cached("capacity")
+def get_machine_capacity():
+    """
+    {machine_key: weekly available hours} from the utilisation sheet's "Max of AvailableHoursPerWeek",
+    via machine_map's resource codes. Bare week numbers are taken as weeks of the current ISO year.
+    """
+    conn = get_db_connection()
+    try:
+        if not inspect(conn).has_table("machine_utilization"):
+            return {}
+        df = pd.read_sql_query('SELECT "ResourceCode", "BookingYear", "WeekNumber", "Plan" FROM machine_utilization', conn)
+    finally:
+        conn.close()
+    years = pd.to_numeric(df["BookingYear"], errors="coerce").fillna(datetime.today().isocalendar().year)
+    weeks = pd.to_numeric(df["WeekNumber"], errors="coerce")
+    df["week_start"] = pd.to_datetime(years.astype("Int64").astype(str) + "-W" + weeks.astype("Int64").astype(str) + "-1",
+                                      format="%G-W%V-%u", errors="coerce")
+    df["hours"] = pd.to_numeric(df["Plan"], errors="coerce")
+    code_to_key = {code: machine_slug_from_name(name) for name, code in machine_map.items()}
+    return {code_to_key[code]: weekly_capacity(rows) for code, rows in df.groupby("ResourceCode") if code in code_to_key}
+
+def add_schedule(data, df, machine_key, today):
+    """Project finish dates against the machine's capacity (capacity.project_schedule) into `data`"""
+    weekly_hours = get_machine_capacity().get(machine_key)
+    schedule = project_schedule(df.assign(machine_key=machine_key), {machine_key: weekly_hours}, today,
+                                capacity_default_weekly_hours)
+    finish = schedule["projected_finish"]
+    labels = finish.dt.strftime("%d-%m-%y").fillna("").tolist()
+    for order, label, overload in zip(data["work_orders"], labels, schedule["overload_hours"].tolist()):
+        order["projected_finish"] = label
+        order["overload_hours"] = 0.0 if pd.isna(overload) else overload
+    summary = summarize_schedule(schedule, df["totalhours"], weekly_hours, today, capacity_default_weekly_hours)
+    summary["clears_on"] = "" if pd.isna(summary["clears_on"]) else summary["clears_on"].strftime("%d-%m-%y")
+    data["schedule"] = summary
+    return data
+
+@snapshot_cache.cached("machine", bypass_arg="as_of")
+def get_dashboard_data(resource_name, machine_type, as_of=None):
     table = "vacuum_data" if machine_type == "vacuum" else "trimming_data"
     conn = get_db_connection()
-    query = f'SELECT * FROM {table} WHERE TRIM(resourcedescription) ILIKE %s'
-    params = (f"%{resource_name.strip()}%",)
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    try:
+        df = read_plan_table(conn, table, as_of, machine_key=machine_slug_from_name(resource_name))
+    finally:
+        conn.close()
 
-    if df.empty:
+    if df is None or df.empty:
         return None
 
-    df["startdate"] = pd.to_datetime(df["startdate"], errors="coerce")
-    df["totalhours"] = pd.to_numeric(df["totalhours"], errors="coerce").fillna(0)
-    df["partsqty"] = pd.to_numeric(df["partsqty"], errors="coerce").fillna(0)
+    df["totalhours"] = df["totalhours"].fillna(0)
+    df["partsqty"] = df["partsqty"].fillna(0)
     df = df.sort_values(by="startdate", ascending=False)
 
-    today = datetime.today().date()
-    total_work_orders = df.shape[0]
-    total_today = df[df["startdate"].dt.date == today].shape[0]
-    total_backlog = total_work_orders - total_today
-
-    work_orders = []
-    for _, row in df.iterrows():
-        printing_status = row["printing status"] if "printing status" in df.columns else "Not Printed"
-        start_date = row["startdate"].date() if pd.notnull(row["startdate"]) else None
-        is_backlog = start_date != today
-
-        work_orders.append({
-            "start_date": row["startdate"].strftime("%d-%m-%y") if pd.notnull(row["startdate"]) else "",
-            "work_order_number": row["worksordernumber"],
-            "part_number": row["partnumber"],
-            "total_hours_required": row["totalhours"],
-            "parts_qty": row["partsqty"],
-            "wo_status": row["wo status"],
-            "printing_status": printing_status,
-            "is_backlog": is_backlog
-        })
-
-    return {
-        "total_work_orders": total_work_orders,
-        "total_today": total_today,
-        "total_backlog": total_backlog,
-        "work_orders": work_orders
-    }
+    today = as_of.date() if as_of else datetime.today().date()
+    data = summarize_work_orders(df, today=today)
+    if as_of is None:
+        summary_header(data, machine_slug_from_name(resource_name))
+    return add_schedule(data, df, machine_slug_from_name(resource_name), today)
 
 # Machine lists
 vacuum_machines = ["Yellow Cannon", "CMS EIDOS", "Blue Cannon Shelley-Max 1450x915", "UNO 810x610", "Red Shelley - Max 810x610"]
@@ -602,19 +1097,45 @@ slug_to_excel_name = {
     "ares-1": "CMS Ares 3618 Prime"
 }
 
-excel_to_html = {
-    "Yellow Cannon": "Yellow Cannon.html",
-    "UNO 810x610": "UNO.html",
-    "Red Shelley - Max 810x610": "Red Cannon.html",
-    "Grimme 2": "Grimme 2.html",
-    "Grimme 1": "Grimme 1.html",
-    "CMS EIDOS": "Eidos.html",
-    "Blue Cannon Shelley-Max 1450x915": "Blue Cannon.html",
-    'CMS Ares "New" Prime': "Ares 3.html",
-    "CMS Ares 4618 Prime": "Ares 2.html",
-    "CMS Ares 3618 Prime": "Ares 1.html",
+# Page title per machine; every machine renders templates/machine.html
+machine_titles = {
+    "Yellow Cannon": "Yellow Cannon",
+    "UNO 810x610": "UNO",
+    "Red Shelley - Max 810x610": "Red Cannon",
+    "Grimme 2": "Grimme 2",
+    "Grimme 1": "Grimme 1",
+    "CMS EIDOS": "Eidos",
+    "Blue Cannon Shelley-Max 1450x915": "Blue Cannon",
+    'CMS Ares "New" Prime': "Ares 3",
+    "CMS Ares 4618 Prime": "Ares 2",
+    "CMS Ares 3618 Prime": "Ares 1",
 }
 
+@snapshot_cache.cached("machine_rows", bypass_arg="as_of")
+def get_machine_rows(excel_name, machine_type, as_of=None):
+    """The work-order table rows (machine_rows.html), rendered once per machine and data version"""
+    data = get_dashboard_data(excel_name, machine_type, as_of)
+    if data is None:
+        return None
+    return render_machine_rows(data["work_orders"])
+
+def render_machine_rows(work_orders):
+    return Markup(render_template("machine_rows.html", work_orders=work_orders))
+
+@snapshot_cache.cached("machine_page", bypass_arg="as_of")
+def get_machine_page(excel_name, machine_type, as_of=None):
+    """The whole machine page around the cached rows, precompressed (see precompress)"""
+    data = get_dashboard_data(excel_name, machine_type, as_of)
+    if data is None:
+        return None
+    page = {key: value for key, value in data.items() if key != "work_orders"}
+    html = render_template("machine.html", machine=excel_name, title=machine_titles.get(excel_name, excel_name),
+                           live_key=machine_slug_from_name(excel_name),
+                           rows=get_machine_rows(excel_name, machine_type) if as_of is None
+                           else render_machine_rows(data["work_orders"]), **page)
+    # History views aren't cached (bypass_arg): no second read for the rows, nothing to precompress
+    return precompress(html) if as_of is None else {"identity": html.encode("utf-8")}
+
 @app.route("/<machine_slug>")
 def machine_dashboard(machine_slug):
     excel_name = slug_to_excel_name.get(machine_slug.lower())
@@ -622,15 +1143,108 @@ def machine_dashboard(machine_slug):
         return "Machine not found", 404
 
     machine_type = "trimming" if excel_name in trimming_machines else "vacuum"
-    data = get_dashboard_data(excel_name, machine_type)
-    if data is None:
+    bodies = get_machine_page(excel_name, machine_type, request_as_of())
+    if bodies is None:
         return jsonify({"error": f"No data found for {excel_name}"}), 404
+    return precompressed_response(bodies)
 
-    template_name = excel_to_html.get(excel_name, "default.html")
-    return render_template(template_name, machine=excel_name, **data)
+# One row per queue, rebuilt by every plan ingest (and on the first read of a new day)
+machine_summary_queues = {
+    # queue → (table, date column, machine_key or None for the whole table)
+    "stores": ("stores_data", "startdate", None),
+    "stores_goods_in": ("stores_goods_in_data", "finishdate", None),
+}
+store_columns = ["worksordernumber", "partnumber", "totalhours", "partsqty", "wo status"]
 
-@app.route("/")
-def index():
+def build_machine_summary(frames, today=None):
+    """
+    machine_summary rows from the four plan frames, one grouped pass per table: work orders
+    (distinct, per machine; rows for the stores queues, as the pages count them), today/backlog
+    rows by the queue's date column, total hours and parts qty.
+    """
+    today = pd.Timestamp(today or datetime.today().date())
+    parts = []
+    for table, machines in (("vacuum_data", vacuum_machines), ("trimming_data", trimming_machines)):
+        df = frames[table]
+        grouped = pd.DataFrame({
+            "queue": df["machine_key"],
+            "worksordernumber": df["worksordernumber"],
+            "is_today": df["startdate"].dt.normalize() == today,
+            "totalhours": df["totalhours"].fillna(0),
+            "partsqty": df["partsqty"].fillna(0),
+        }).groupby("queue", observed=True).agg(
+            work_orders=("worksordernumber", "nunique"), rows=("is_today", "size"), today=("is_today", "sum"),
+            total_hours=("totalhours", "sum"), parts_qty=("partsqty", "sum"))
+        keys = [machine_slug_from_name(name) for name in machines]
+        parts.append(grouped.reindex(keys, fill_value=0).assign(table=table))
+    for queue, (table, date_col, _) in machine_summary_queues.items():
+        # Same rows the stores pages keep after dropna(how="all")
+        df = frames[table].dropna(subset=[date_col] + store_columns, how="all")
+        is_today = df[date_col].dt.normalize() == today
+        parts.append(pd.DataFrame({
+            "work_orders": [len(df)], "rows": [len(df)], "today": [int(is_today.sum())],
+            "total_hours": [df["totalhours"].fillna(0).sum()],
+            "parts_qty": [df["partsqty"].fillna(0).sum()], "table": [table],
+        }, index=[queue]))
+    summary = pd.concat(parts).rename_axis("queue").reset_index()
+    summary["backlog"] = summary["rows"] - summary["today"]
+    summary["summary_date"] = today.date().isoformat()
+    return summary[["queue", "table", "work_orders", "rows", "today", "backlog", "total_hours", "parts_qty",
+                    "summary_date"]]
+
+def write_machine_summary(conn, frames):
+    summary = build_machine_summary(frames)
+    bulk_load(conn, "machine_summary", summary, if_exists="replace")
+    return len(summary)
+
+def refresh_machine_summary():
+    """Rebuild machine_summary from the live tables (e.g. the day rolled over since the last ingest)"""
+    with locked_transaction(get_engine(), ingest_write_lock, refresh_lock_dir) as conn:
+        frames = {table: read_plan_table(conn, table)
+                  for table in ("vacuum_data", "trimming_data", "stores_data", "stores_goods_in_data")}
+        for table in ("vacuum_data", "trimming_data"):
+            if "machine_key" not in frames[table].columns:
+                # Loaded before machine_key existed; the next ingest reloads it (plan_layout_current)
+                add_machine_keys(frames[table])
+        write_machine_summary(conn, frames)
+
+@snapshot_cache.cached("machine_summary")
+def get_machine_summary():
+    """{queue: machine_summary row} — machine slugs plus "stores" and "stores_goods_in"; {} before the first load"""
+    query = text("SELECT * FROM machine_summary")
+    today = datetime.today().date().isoformat()
+    for attempt in range(2):
+        conn = get_db_connection()
+        try:
+            rows = [dict(row) for row in conn.execute(query).mappings()] \
+                if inspect(conn).has_table("machine_summary") else []
+            has_plan = inspect(conn).has_table("vacuum_data")
+        finally:
+            conn.close()
+        if (rows and rows[0]["summary_date"] == today) or not has_plan or attempt:
+            return {row["queue"]: row for row in rows}
+        refresh_machine_summary()
+
+def get_index_counts():
+    """
+    Every landing-page count, from machine_summary: distinct WOs per machine and the
+    stores/goods-in row counts. Returns {machine name: count, "stores": n, "stores_goods_in": n}
+    """
+    summary = get_machine_summary()
+    counts = {queue: summary.get(queue, {}).get("work_orders", 0) for queue in machine_summary_queues}
+    for machine_name in vacuum_machines + trimming_machines:
+        counts[machine_name] = summary.get(machine_slug_from_name(machine_name), {}).get("work_orders", 0)
+    return counts
+
+def summary_header(data, queue):
+    """Page header totals from machine_summary (live data only), in place of the ones counted from the rows"""
+    row = get_machine_summary().get(queue)
+    if row is not None:
+        data.update(total_work_orders=row["rows"], total_today=row["today"], total_backlog=row["backlog"])
+    return data
+
+@snapshot_cache.cached("index")
+def get_index_data():
     display_name_map = {
         "Blue Cannon Shelley-Max 1450x915": "Blue Cannon",
         "UNO 810x610": "UNO",
@@ -640,43 +1254,31 @@ def index():
         "CMS Ares 3618 Prime": "Ares 1"
     }
 
-    conn = get_db_connection()
+    counts = get_index_counts()
     machine_data = []
 
     # Stores first
-    stores_data = get_stores_data()
-    if stores_data:
-        machine_data.append({
-            "name": "Stores-Prep",
-            "category": "Stores",
-            "target": stores_data["total_work_orders"],
-            "todo": "NA",
-            "done": "NA",
-            "url": "/stores"
-        })
+    machine_data.append({
+        "name": "Stores-Prep",
+        "category": "Stores",
+        "target": counts["stores"],
+        "todo": "NA",
+        "done": "NA",
+        "url": "/stores"
+    })
 
     # Stores Goods In
-    stores_goods_in_data = get_stores_goods_in_data()
-    if stores_goods_in_data:
-        machine_data.append({
-            "name": "Stores-Goods In",
-            "category": "Stores",
-            "target": stores_goods_in_data["total_work_orders"],
-            "todo": "NA",
-            "done": "NA",
-            "url": "/stores_goods_in"
-        })
+    machine_data.append({
+        "name": "Stores-Goods In",
+        "category": "Stores",
+        "target": counts["stores_goods_in"],
+        "todo": "NA",
+        "done": "NA",
+        "url": "/stores_goods_in"
+    })
 
     for machine_name in vacuum_machines + trimming_machines:
-        table = "vacuum_data" if machine_name in vacuum_machines else "trimming_data"
-        query = f'SELECT COUNT(DISTINCT worksordernumber) FROM {table} WHERE TRIM(resourcedescription) ILIKE %s'
-
-        cur = conn.cursor()
-        cur.execute(query, (f"%{machine_name.strip()}%",))
-        result = cur.fetchone()
-        cur.close()
-
-        total_wos = result[0] if result else 0
+        total_wos = counts[machine_name]
         display_name = display_name_map.get(machine_name, machine_name)
 
         machine_data.append({
@@ -688,8 +1290,11 @@ def index():
             "url": f"/{machine_slug_from_name(machine_name)}"
         })
 
-    conn.close()
-    return render_template("index1.html", machines=machine_data)
+    return machine_data
+
+@app.route("/")
+def index():
+    return render_template("index1.html", machines=get_index_data())
 
 def machine_slug_from_name(name):
     for slug, excel_name in slug_to_excel_name.items():
@@ -732,26 +1337,391 @@ def to_date(value):
         return value  # fallback (leave it unchanged)
 
 
+@snapshot_cache.cached("complete", bypass_arg="as_of")
+def get_complete_data(as_of=None):
+    conn = get_db_connection()
+    try:
+        vacuum_df = read_plan_table(conn, "vacuum_data", as_of)
+        trimmer_df = read_plan_table(conn, "trimming_data", as_of)
+        stores_prep_df = read_plan_table(conn, "stores_data", as_of)
+        goods_in_df = read_plan_table(conn, "stores_goods_in_data", as_of)
+    finally:
+        conn.close()
+    if vacuum_df is None:
+        return None
+
+    return {
+        "vacuum": vacuum_df.to_dict(orient="records"),
+        "trimmers": trimmer_df.to_dict(orient="records"),
+        "stores_prep": stores_prep_df.to_dict(orient="records"),
+        "goods_in": goods_in_df.to_dict(orient="records"),
+    }
+
 @app.route("/complete")
 def complete():
+    data = get_complete_data(request_as_of())
+    if data is None:
+        return jsonify({"error": "No data found"}), 404
+    return render_template("complete.html", machine_map=machine_map, **data)
+
+@app.route("/cache_stats")
+def cache_stats():
+    return jsonify(snapshot_cache.stats())
+
+@app.route("/pool_stats")
+def db_pool_stats():
+    return jsonify(pool_stats())
+
+@app.route("/scheduler_stats")
+def scheduler_stats():
+    return jsonify(_scheduler.stats() if _scheduler else {"running": False})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    if "request_started" in g:
+        # The URL rule, not the path, so /<machine_slug> is one series however it's called
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request_seconds.observe(time.perf_counter() - g.request_started,
+                                route=route, method=request.method, status=response.status_code)
+    return response
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def observe_render(sender, template, context, **extra):
+    if g.get("render_started"):
+        render_seconds.observe(time.perf_counter() - g.render_started.pop(), template=template.name)
+
+def _ingest_age_samples():
+    """Seconds since each source's last successful ingest, from ingest_state"""
+    try:
+        with get_engine().connect() as conn:
+            if not inspect(conn).has_table("ingest_state"):
+                return []
+            rows = conn.execute(text("SELECT source, updated_at FROM ingest_state")).all()
+    except Exception:
+        return []
+    now = datetime.now()
+    return [({"source": source}, (now - pd.Timestamp(updated_at).to_pydatetime()).total_seconds())
+            for source, updated_at in rows if updated_at is not None]
+
+metrics.gauge("dashboard_ingest_last_success_age_seconds", "Seconds since the last successful ingest by source",
+              _ingest_age_samples)
+metrics.gauge("dashboard_cache_lookups", "Snapshot cache hits and misses since start",
+              lambda: [({"result": "hit"}, snapshot_cache.hits), ({"result": "miss"}, snapshot_cache.misses)])
+metrics.gauge("dashboard_db_pool", "DB pool connections and checkout waits",
+              lambda: [({"stat": name}, value) for name, value in pool_stats().items()])
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# --- 📤 Streaming exports (/export/<table>.csv|.parquet) ---
+# Rows come from a server-side cursor in chunks and go straight out in a generator response,
+# so memory stays flat however big the table is (unlike /complete, which loads everything).
+export_tables = {
+    "vacuum": "vacuum_data",
+    "trimmers": "trimming_data",
+    "stores_prep": "stores_data",
+    "goods_in": "stores_goods_in_data",
+}
+export_chunk_rows = 5000
+
+def _export_chunks(conn, table):
+    """(reflected table, iterator of row chunks) read through `conn`, which the caller closes"""
+    db_table = Table(table, MetaData(), autoload_with=conn)
+    result = conn.execution_options(stream_results=True, yield_per=export_chunk_rows).execute(db_table.select())
+    return db_table, result.partitions()
+
+def stream_csv(table):
+    # Closed in finally, so a client that disconnects mid-download hands the connection straight back
     conn = get_db_connection()
-    vacuum_df = pd.read_sql_query("SELECT * FROM vacuum_data", conn)
-    trimmer_df = pd.read_sql_query("SELECT * FROM trimming_data", conn)
-    stores_prep_df = pd.read_sql_query("SELECT * FROM stores_data", conn)
-    goods_in_df = pd.read_sql_query("SELECT * FROM stores_goods_in_data", conn)
-    conn.close()
-
-    return render_template(
-        "complete.html",
-        vacuum=vacuum_df.to_dict(orient="records"),
-        trimmers=trimmer_df.to_dict(orient="records"),
-        stores_prep=stores_prep_df.to_dict(orient="records"),
-        goods_in=goods_in_df.to_dict(orient="records"),
-        machine_map=machine_map
-    )
+    try:
+        db_table, chunks = _export_chunks(conn, table)
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        # The BOM makes Excel open the file as UTF-8; the header is quoted like any other row
+        buffer.write("\ufeff")
+        writer.writerow(db_table.columns.keys())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for chunk in chunks:
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        conn.close()
+
+class _ChunkSink(RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain()"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+def _arrow_type(sql_type):
+    import pyarrow as pa
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, (types.Float, types.Numeric)):
+        return pa.float64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, types.Date):
+        return pa.date32()
+    return pa.string()
+
+def stream_parquet(table):
+    """One Parquet row group per chunk; each is sent as soon as it's encoded"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    conn = get_db_connection()
+    try:
+        db_table, chunks = _export_chunks(conn, table)
+        schema = pa.schema([(column.name, _arrow_type(column.type)) for column in db_table.columns])
+        sink = _ChunkSink()
+        with pq.ParquetWriter(sink, schema) as writer:
+            for chunk in chunks:
+                columns = zip(*chunk)
+                writer.write_batch(pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+                yield sink.drain()
+        yield sink.drain()
+    finally:
+        conn.close()
+
+@app.route("/export/<name>.csv", defaults={"fmt": "csv"})
+@app.route("/export/<name>.parquet", defaults={"fmt": "parquet"})
+def export_table(name, fmt):
+    table = export_tables.get(name, name if name in export_tables.values() else None)
+    if table is None:
+        return jsonify({"error": f"Unknown table, expected one of: {', '.join(export_tables)}"}), 404
+    if not inspect(get_engine()).has_table(table):
+        return jsonify({"error": f"No data found for {name}"}), 404
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({"error": "Parquet export needs pyarrow installed"}), 501
+
+    stream, mimetype = (stream_csv, "text/csv") if fmt == "csv" else (stream_parquet, "application/vnd.apache.parquet")
+    return Response(stream(table), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'})
+
+
+# --- 📡 JSON API (/api/v1) ---
+# Same data as the dashboard pages, paginated and filterable. Responses carry an ETag
+# derived from the ingest version, so polling screens get a 304 until the next refresh.
+api_default_limit = 100
+api_max_limit = 1000
+
+complete_sections = {
+    "vacuum": ("startdate", "wo status"),
+    "trimmers": ("startdate", "wo status"),
+    "stores_prep": ("startdate", "wo status"),
+    "goods_in": ("finishdate", "wo status"),
+}
+
+def api_data_fingerprint():
+    return hashlib.sha1(repr(snapshot_cache.version()).encode()).hexdigest()[:12]
+
+def api_etag():
+    return hashlib.sha1(f"{api_data_fingerprint()}|{request.full_path}".encode()).hexdigest()
+
+def _json_safe(value):
+    if isinstance(value, float) and value != value:
+        return None
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return value
+
+def _parse_api_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"'{name}' must be YYYY-MM-DD")
+
+def _parse_api_limit():
+    try:
+        limit = int(request.args.get("limit", api_default_limit))
+    except ValueError:
+        limit = 0
+    # limit=0 would hand back a cursor at the same offset, and a client following it loops forever
+    if limit < 1:
+        raise ValueError("'limit' must be a whole number of at least 1")
+    return min(limit, api_max_limit)
+
+def _parse_api_cursor():
+    """(data fingerprint, offset) from ?cursor=, or (None, 0) without one"""
+    value = request.args.get("cursor")
+    if not value:
+        return None, 0
+    try:
+        version, offset = base64.urlsafe_b64decode(value).decode().split(":")
+        offset = int(offset)
+    except ValueError:  # bad base64, bad UTF-8, wrong shape, non-numeric offset
+        offset = -1
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return version, offset
+
+def _record_dates(records, date_field):
+    """Record date values → date, parsing each distinct value once ("%d-%m-%y" strings or timestamps)"""
+    parsed = {}
+    for record in records:
+        value = record.get(date_field)
+        if value not in parsed:
+            if isinstance(value, str) and len(value) == 8:
+                parsed[value] = datetime.strptime(value, "%d-%m-%y").date()
+            else:
+                ts = pd.to_datetime(value, errors="coerce")
+                parsed[value] = None if pd.isna(ts) else ts.date()
+        yield parsed[value]
+
+def api_page(records, date_field, status_field, summary=None):
+    """Filter, project and paginate `records` per the request's query string"""
+    etag = api_etag()
+    fingerprint = api_data_fingerprint()
+
+    try:
+        date_from, date_to = _parse_api_date("from"), _parse_api_date("to")
+        limit = _parse_api_limit()
+        cursor_version, offset = _parse_api_cursor()
+    except ValueError as e:
+        # Only the fixed messages raised by the _parse_api_* helpers reach the client
+        return jsonify({"error": str(e)}), 400
+    if cursor_version is not None and cursor_version != fingerprint:
+        return jsonify({"error": "Cursor expired: the data was refreshed, start again without a cursor"}), 410
+
+    statuses = {s.strip().lower() for s in request.args.get("status", "").split(",") if s.strip()}
+    if statuses:
+        records = [r for r in records if str(r.get(status_field, "")).lower() in statuses]
+    if request.args.get("backlog", "").lower() in ("1", "true", "yes"):
+        records = [r for r in records if r.get("is_backlog")]
+    if date_from or date_to:
+        records = [r for r, d in zip(records, _record_dates(records, date_field))
+                   if d is not None and (not date_from or d >= date_from) and (not date_to or d <= date_to)]
+
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    if fields and records:
+        unknown = [f for f in fields if f not in records[0]]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    page = records[offset:offset + limit]
+    items = [{k: _json_safe(r[k]) for k in (fields or r.keys())} for r in page]
+    next_offset = offset + len(page)
+    next_cursor = None
+    if next_offset < len(records):
+        next_cursor = base64.urlsafe_b64encode(f"{fingerprint}:{next_offset}".encode()).decode()
+
+    response = jsonify({**(summary or {}), "matched": len(records), "count": len(items),
+                        "next_cursor": next_cursor, "items": items})
+    return with_etag(response, etag)
+
+def with_etag(response, etag=None):
+    response.headers["ETag"] = f'"{etag or api_etag()}"'
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def api_not_modified():
+    """304 before touching any data when the client already has this version"""
+    if request.if_none_match and request.if_none_match.contains(api_etag()):
+        return with_etag(app.response_class(status=304))
+    return None
+
+def _work_order_page(data, date_field):
+    summary = {k: data[k] for k in ("total_work_orders", "total_today", "total_backlog", "schedule") if k in data}
+    return api_page(data["work_orders"], date_field, "wo_status", summary)
+
+@app.route("/api/v1/machines")
+def api_machines():
+    return api_not_modified() or with_etag(jsonify(get_index_data()))
+
+@app.route("/api/v1/machines/<machine_slug>")
+def api_machine(machine_slug):
+    excel_name = slug_to_excel_name.get(machine_slug.lower())
+    if not excel_name:
+        return jsonify({"error": "Machine not found"}), 404
+    not_modified = api_not_modified()
+    if not_modified:
+        return not_modified
+
+    machine_type = "trimming" if excel_name in trimming_machines else "vacuum"
+    data = get_dashboard_data(excel_name, machine_type, request_as_of())
+    if data is None:
+        return jsonify({"error": f"No data found for {excel_name}"}), 404
+    return _work_order_page(data, "start_date")
+
+@app.route("/api/v1/stores")
+def api_stores():
+    not_modified = api_not_modified()
+    if not_modified:
+        return not_modified
+    data = get_stores_data(request_as_of())
+    if data is None:
+        return jsonify({"error": "No data found for Stores"}), 404
+    return _work_order_page(data, "start_date")
+
+@app.route("/api/v1/stores_goods_in")
+def api_stores_goods_in():
+    not_modified = api_not_modified()
+    if not_modified:
+        return not_modified
+    data = get_stores_goods_in_data(request_as_of())
+    if data is None:
+        return jsonify({"error": "No data found for Stores"}), 404
+    return _work_order_page(data, "finish_date")
+
+@app.route("/api/v1/complete/<section>")
+def api_complete(section):
+    if section not in complete_sections:
+        return jsonify({"error": f"Unknown section, expected one of: {', '.join(complete_sections)}"}), 404
+    not_modified = api_not_modified()
+    if not_modified:
+        return not_modified
+    date_field, status_field = complete_sections[section]
+    data = get_complete_data(request_as_of())
+    if data is None:
+        return jsonify({"error": "No data found"}), 404
+    return api_page(data[section], date_field, status_field)
 
 
 if __name__ == "__main__":
     print("Loading Excel data from SharePoint into local DB initially...")
-    create_db_and_load_excel()
-    app.run(debug=True)
+    ingest()
+    scheduled_refresh()
+    socketio.run(app, debug=True)
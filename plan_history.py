@@ -0,0 +1,157 @@
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text, and_, bindparam, delete,
+                        exists, insert, inspect, or_, select, update)
+
+metadata = MetaData()
+
+ingest_runs = Table(
+    "ingest_runs", metadata,
+    Column("run_id", Integer, primary_key=True, autoincrement=True),
+    Column("source", String(32), nullable=False),
+    Column("version", Text),
+    Column("started_at", DateTime, nullable=False),
+    Index("ix_ingest_runs_started", "source", "started_at"),
+)
+
+# One row per version of a work-order row, visible to the runs in [valid_from, valid_to);
+# valid_to is NULL while the version is current
+plan_history = Table(
+    "plan_history", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("table_name", String(64), nullable=False),
+    Column("worksordernumber", Text),
+    Column("machine_key", Text),
+    Column("valid_from", Integer, nullable=False),
+    Column("valid_to", Integer),
+    Column("row_data", Text, nullable=False),
+    Index("ix_plan_history_valid_to", "table_name", "valid_to"),
+    Index("ix_plan_history_machine", "table_name", "machine_key", "valid_to"),
+)
+
+
+def _key(value):
+    return None if value is None or (not isinstance(value, str) and pd.isna(value)) else str(value)
+
+
+def _versions(df, key_column):
+    """{work order: sorted row JSON} — the unit of change is the work order, not the row"""
+    if df.empty:
+        return {}
+    # pandas' C JSON writer; control characters inside strings are escaped, so one line per row
+    rows = df.to_json(orient="records", lines=True, date_format="iso").rstrip("\n").split("\n")
+    machine_keys = df["machine_key"].tolist() if "machine_key" in df.columns else [None] * len(df)
+    versions = {}
+    for wo, machine_key, row in zip(df[key_column].tolist(), machine_keys, rows):
+        versions.setdefault(_key(wo), []).append((row, _key(machine_key)))
+    return {wo: sorted(rows) for wo, rows in versions.items()}
+
+
+def record_snapshot(conn, frames, source="plan", version=None, started_at=None, key_column="worksordernumber"):
+    """
+    Append one ingest run to the history. Per table, only work orders whose rows changed (added,
+    edited or removed) get a new version; everything else keeps its open version, so a run that
+    touches 20 work orders costs 20-ish rows, not a copy of the table.
+    Call it in the same transaction as the table writes.
+    :param frames: {table name: DataFrame} as loaded into the live tables.
+    :return: (run_id, {table: number of changed work orders})
+    """
+    metadata.create_all(conn)
+    run_id = conn.execute(insert(ingest_runs).values(
+        source=source, version=version, started_at=started_at or datetime.now())).inserted_primary_key[0]
+
+    changed = {}
+    for table, df in frames.items():
+        new = _versions(df, key_column)
+        old, old_ids = {}, {}
+        for row_id, wo, machine_key, row in conn.execute(
+                select(plan_history.c.id, plan_history.c.worksordernumber, plan_history.c.machine_key,
+                       plan_history.c.row_data)
+                .where(plan_history.c.table_name == table, plan_history.c.valid_to.is_(None))):
+            old.setdefault(wo, []).append((row, machine_key))
+            old_ids.setdefault(wo, []).append(row_id)
+
+        changed_keys = [wo for wo in new.keys() | old.keys() if new.get(wo) != sorted(old.get(wo, []))]
+        closing = [{"row_id": row_id} for wo in changed_keys for row_id in old_ids.get(wo, [])]
+        if closing:
+            conn.execute(update(plan_history).where(plan_history.c.id == bindparam("row_id"))
+                         .values(valid_to=run_id), closing)
+        opening = [{"table_name": table, "worksordernumber": wo, "machine_key": machine_key,
+                    "valid_from": run_id, "valid_to": None, "row_data": row}
+                   for wo in changed_keys for row, machine_key in new.get(wo, [])]
+        if opening:
+            conn.execute(insert(plan_history), opening)
+        changed[table] = len(changed_keys)
+    return run_id, changed
+
+
+def run_as_of(conn, as_of, source="plan"):
+    """Id of the latest `source` run started at or before `as_of`, or None"""
+    if not inspect(conn).has_table(ingest_runs.name):
+        return None
+    return conn.execute(
+        select(ingest_runs.c.run_id)
+        .where(ingest_runs.c.source == source, ingest_runs.c.started_at <= as_of)
+        .order_by(ingest_runs.c.started_at.desc(), ingest_runs.c.run_id.desc())
+        .limit(1)
+    ).scalar()
+
+
+def snapshot_frame(conn, table, run_id, machine_key=None, parse_dates=()):
+    """
+    Contents of `table` as loaded by run `run_id` (optionally one machine's rows).
+    Row order is not preserved; `parse_dates` columns come back as datetimes, like read_sql's.
+    """
+    query = select(plan_history.c.row_data).where(
+        plan_history.c.table_name == table,
+        plan_history.c.valid_from <= run_id,
+        or_(plan_history.c.valid_to.is_(None), plan_history.c.valid_to > run_id),
+    )
+    if machine_key is not None:
+        query = query.where(plan_history.c.machine_key == machine_key)
+    df = pd.DataFrame.from_records([json.loads(row) for row in conn.execute(query).scalars()])
+    for column in parse_dates:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+    return df
+
+
+def compact_history(conn, retention_days=180, daily_after_days=7, source="plan", now=None):
+    """
+    Retention/compaction: runs older than `retention_days` are dropped, runs older than
+    `daily_after_days` are thinned to the last run of each day, then every version that no
+    remaining run can see is deleted. The latest run is always kept.
+    :return: {"runs_deleted": n, "versions_deleted": n}
+    """
+    if not inspect(conn).has_table(ingest_runs.name):
+        return {"runs_deleted": 0, "versions_deleted": 0}
+    now = now or datetime.now()
+    retention_cutoff = now - timedelta(days=retention_days)
+    old = conn.execute(
+        select(ingest_runs.c.run_id, ingest_runs.c.started_at)
+        .where(ingest_runs.c.source == source, ingest_runs.c.started_at < now - timedelta(days=daily_after_days))
+        .order_by(ingest_runs.c.started_at, ingest_runs.c.run_id)
+    ).all()
+    latest = conn.execute(select(ingest_runs.c.run_id).where(ingest_runs.c.source == source)
+                          .order_by(ingest_runs.c.started_at.desc(), ingest_runs.c.run_id.desc()).limit(1)).scalar()
+
+    last_of_day = {}
+    for run_id, started_at in old:
+        last_of_day[started_at.date()] = run_id
+    keep = set(last_of_day.values()) | {latest}
+    drop = [run_id for run_id, started_at in old
+            if run_id != latest and (run_id not in keep or started_at < retention_cutoff)]
+    for i in range(0, len(drop), 1000):
+        conn.execute(delete(ingest_runs).where(ingest_runs.c.run_id.in_(drop[i:i + 1000])))
+
+    # A primary-key range probe per version; filtering on source as well would steer the
+    # planner onto the (source, started_at) index and scan every run for every version
+    visible = exists().where(
+        ingest_runs.c.run_id >= plan_history.c.valid_from,
+        ingest_runs.c.run_id < plan_history.c.valid_to,
+    )
+    versions_deleted = conn.execute(
+        delete(plan_history).where(and_(plan_history.c.valid_to.is_not(None), ~visible))).rowcount
+    return {"runs_deleted": len(drop), "versions_deleted": versions_deleted}
@@ -0,0 +1,68 @@
+import pandas as pd
+from sqlalchemy import types
+
+# Declared type of every plan-table column (after clean_and_prepare_df's renaming); columns the
+# sheet grows that aren't listed here are left as read
+plan_column_types = {
+    "resourcedescription": "category",
+    "machine_key": "category",
+    "wo status": "category",
+    "printing status": "category",
+    "startdate": "datetime",
+    "finishdate": "datetime",
+    "worksordernumber": "text",
+    "partnumber": "text",
+    "totalhours": "float",
+    "partsqty": "int",
+}
+
+# Categories are stored as TEXT: the code → label mapping is rebuilt from the values on read
+sql_types = {
+    "category": types.Text,
+    "datetime": types.DateTime,
+    "text": types.Text,
+    "float": types.Float,
+    "int": types.BigInteger,
+}
+
+
+def _label(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # 1001.0 read from Excel → "1001"
+    return str(value)
+
+
+def _text(values, blanks=None):
+    """Strings, with `blanks` for missing values; numbers typed into a text column (e.g. a bare work-order number) become strings"""
+    values = values.astype(object)
+    present = values.notna()
+    if pd.api.types.infer_dtype(values, skipna=True) != "string":
+        values = values.where(~present, values[present].map(_label))
+    return values if present.all() else values.where(present, blanks)
+
+
+def apply_schema(df, column_types=plan_column_types):
+    """
+    Coerce `df` to the declared types: datetime64 dates, nullable Int64 quantities, float hours,
+    categorical statuses/resources and plain-string identifiers. Unparseable values become
+    missing, as the readers' pd.to_datetime/pd.to_numeric(errors="coerce") used to make them.
+    Columns already of the declared type are left alone, so it is cheap on typed frames.
+    """
+    for column in df.columns.intersection(list(column_types)):
+        kind, values = column_types[column], df[column]
+        if kind == "datetime" and not pd.api.types.is_datetime64_any_dtype(values):
+            df[column] = pd.to_datetime(values, errors="coerce", format="mixed")
+        elif kind == "float" and not pd.api.types.is_float_dtype(values):
+            df[column] = pd.to_numeric(values, errors="coerce").astype(float)
+        elif kind == "int" and not isinstance(values.dtype, pd.Int64Dtype):
+            df[column] = pd.to_numeric(values, errors="coerce").round().astype("Int64")
+        elif kind == "category" and not isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = _text(values, blanks=float("nan")).astype("category")
+        elif kind == "text":
+            df[column] = _text(values)
+    return df
+
+
+def column_sql_types(columns, column_types=plan_column_types):
+    """{column: SQLAlchemy type} for the declared columns among `columns` (to_sql dtype= / text().columns())"""
+    return {column: sql_types[column_types[column]]() for column in columns if column in column_types}
@@ -0,0 +1,73 @@
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.utils import column_index_from_string
+from pandas.io.parsers import TextParser
+import numpy as np
+
+
+def column_range(usecols):
+    """Convert an Excel column range like "M:S" → (start, stop) 0-based slice bounds"""
+    first, last = usecols.split(":")
+    return column_index_from_string(first.strip()) - 1, column_index_from_string(last.strip())
+
+
+def _convert_cell(cell):
+    # Same conversion pandas applies in its openpyxl reader, so the frames
+    # come out identical to pd.read_excel(..., engine="openpyxl")
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def read_sheet_blocks(file_stream, sheet_name, blocks):
+    """
+    Stream one worksheet a single time and split it into several DataFrames.
+    :param file_stream: Workbook bytes (file-like object).
+    :param sheet_name: Worksheet to read.
+    :param blocks: Mapping of name → (usecols, header_row), e.g. {"vacuum": ("M:S", 11)}.
+    :return: Mapping of name → DataFrame, matching what pd.read_excel would return
+             for the same usecols/header on that sheet.
+    """
+    ranges = {name: column_range(usecols) for name, (usecols, _) in blocks.items()}
+    first_row = min(header for _, header in blocks.values())
+    needed = sorted({i for start, stop in ranges.values() for i in range(start, stop)})
+    position = {col: pos for pos, col in enumerate(needed)}
+
+    wb = load_workbook(file_stream, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = wb[sheet_name]
+        sheet.reset_dimensions()
+
+        rows = []
+        last_row_with_data = -1
+        for row_number, row in enumerate(sheet.rows):
+            if any(cell.value is not None and cell.value != "" for cell in row):
+                last_row_with_data = row_number
+            if row_number < first_row:
+                continue
+            values = [""] * len(needed)
+            for col in needed:
+                if col < len(row):
+                    values[position[col]] = _convert_cell(row[col])
+            rows.append(values)
+    finally:
+        wb.close()
+
+    # Trim trailing empty rows (judged on the whole row, like pandas does)
+    rows = rows[: max(last_row_with_data + 1 - first_row, 0)]
+
+    frames = {}
+    for name, (start, stop) in ranges.items():
+        header = blocks[name][1]
+        cols = [position[i] for i in range(start, stop)]
+        data = [[row[c] for c in cols] for row in rows[header - first_row:]]
+        parser = TextParser(data, header=0, skip_blank_lines=False)
+        frames[name] = parser.read()
+    return frames
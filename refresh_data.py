@@ -1,12 +1,17 @@
-from main import create_db_and_load_excel, update_machine_utilization, engine
+import sys
+
+from main import ingest
 
 if __name__ == "__main__":
     print("🚀 Starting automated SharePoint Excel refresh & DB update...")
 
-    # Step 2: Once refresh completes, download and load data
-    create_db_and_load_excel()
+    # Download both workbooks and load them into the database
+    report = ingest()
 
-    # Step 3: Update machine utilization in the database
-    update_machine_utilization(engine)
+    failed = {name: entry.get("error") for name, entry in report["sources"].items() if entry["status"] == "error"}
+    if failed:
+        for name, error in failed.items():
+            print(f"❌ {name} refresh failed: {error}")
+        sys.exit(1)
 
     print("✅ Full refresh and database update completed successfully.")
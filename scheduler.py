@@ -0,0 +1,296 @@
+import atexit
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+
+def _lock_key(name):
+    # pg advisory locks take a bigint key
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big", signed=True)
+
+
+class AdvisoryLock:
+    """
+    Leadership through a PostgreSQL session-level advisory lock, held on one dedicated
+    connection for as long as this process leads. If the connection drops, the server
+    releases the lock and another process can take over.
+    """
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.key = _lock_key(name)
+        self._conn = None
+
+    def acquire(self):
+        """Try to take the lock (non-blocking). If already held, checks the connection is still alive."""
+        try:
+            if self._conn is not None:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            self._conn = self.engine.connect()
+            held = self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+            # End the implicit transaction; the session lock outlives it
+            self._conn.commit()
+            if not held:
+                self._close()
+            return bool(held)
+        except Exception:
+            self._close()
+            return False
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._conn.commit()
+        except Exception:
+            pass
+        self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.invalidate()  # don't hand a lock-holding session back to the pool
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+
+
+def _lock_file(lock_file, blocking):
+    """Exclusive lock on an open file: flock() on POSIX, msvcrt.locking on Windows (fcntl isn't there)"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        lock_file.seek(0)
+        while True:
+            try:
+                # LK_LOCK itself gives up after ~10 one-second retries
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not blocking:
+                    raise
+    else:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+
+
+def _unlock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """Leadership through an exclusive lock on a lock file, for SQLite or single-host setups"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=False):
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, "a")
+        try:
+            _lock_file(lock_file, blocking)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            _unlock_file(self._file)
+            self._file.close()
+            self._file = None
+
+
+def leader_lock(engine, name, lock_dir=None):
+    """Advisory lock on PostgreSQL, otherwise a file lock in `lock_dir` (default: the temp dir)"""
+    if engine.dialect.name == "postgresql":
+        return AdvisoryLock(engine, name)
+    return FileLock(os.path.join(lock_dir or tempfile.gettempdir(), f"{name}.lock"))
+
+
+@contextmanager
+def locked_transaction(engine, name, lock_dir=None):
+    """
+    engine.begin(), serialized across processes under `name`: pg_advisory_xact_lock (released at
+    commit/rollback) on PostgreSQL, otherwise a blocking file lock held until the commit.
+    The lock is taken before anything is read, so two writers never diff against the same snapshot.
+    Use a different name from the leader lock: the leader's session lock would block it.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _lock_key(name)})
+            yield conn
+        return
+    lock = FileLock(os.path.join(lock_dir or tempfile.gettempdir(), f"{name}.lock"))
+    lock.acquire(blocking=True)
+    try:
+        with engine.begin() as conn:
+            yield conn
+    finally:
+        lock.release()
+
+
+class Job:
+    def __init__(self, name, func, interval, jitter, run_at_start):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = 0.0 if run_at_start else self._after(time.monotonic())
+        self.running = threading.Lock()
+        self.thread = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+        self.last = None
+        self.history = deque(maxlen=20)
+
+    def _after(self, now):
+        # Spread runs a little so jobs started together don't stay in lockstep
+        return now + self.interval * (1 + random.uniform(0, self.jitter))
+
+    def stats(self):
+        return {
+            "interval_seconds": self.interval,
+            "running": self.running.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "seconds_total": round(self.seconds_total, 3),
+            "seconds_max": round(self.seconds_max, 3),
+            "seconds_avg": round(self.seconds_total / self.runs, 3) if self.runs else None,
+            "last": self.last,
+            "history": list(self.history),
+        }
+
+
+class RefreshScheduler:
+    """
+    Background scheduler for the ingest jobs, run by a single leader process.
+    - leadership comes from `lock` (see leader_lock); followers keep retrying every `leader_retry` seconds
+    - each job has its own interval (plus jitter) and runs in its own thread
+    - a job that is still running when it falls due again is skipped, not stacked
+    - stop() (also registered with atexit) waits for running jobs, then gives up leadership
+    """
+
+    def __init__(self, lock, tick=1.0, leader_retry=30.0):
+        self.lock = lock
+        self.tick = tick
+        self.leader_retry = leader_retry
+        self.jobs = {}
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader_checked_at = None
+
+    def add_job(self, name, func, interval, jitter=0.1, run_at_start=False):
+        """:param func: Called with no arguments; its return value is recorded as the run's result."""
+        self.jobs[name] = Job(name, func, interval, jitter, run_at_start)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="refresh-scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=60):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for job in self.jobs.values():
+            if job.thread is not None:
+                job.thread.join(timeout)
+        if self.is_leader:
+            self.lock.release()
+            self.is_leader = False
+
+    def run_now(self, name):
+        """Start a job immediately (leader or not). Returns False if it's already running."""
+        return self._trigger(self.jobs[name], time.monotonic())
+
+    def stats(self):
+        return {
+            "leader": self.is_leader,
+            "running": self._thread is not None and not self._stop.is_set(),
+            "jobs": {name: job.stats() for name, job in self.jobs.items()},
+        }
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self._leader_checked_at is None or now - self._leader_checked_at >= self.leader_retry:
+                self._leader_checked_at = now
+                self._check_leadership()
+            if self.is_leader:
+                for job in self.jobs.values():
+                    if now >= job.next_run:
+                        self._trigger(job, now)
+            self._stop.wait(self.tick)
+
+    def _check_leadership(self):
+        was_leader = self.is_leader
+        self.is_leader = self.lock.acquire()
+        if self.is_leader and not was_leader:
+            log.info("Refresh scheduler: this process (pid %d) is the leader.", os.getpid())
+        elif was_leader and not self.is_leader:
+            log.warning("Refresh scheduler: leadership lost, pausing jobs.")
+
+    def _trigger(self, job, now):
+        job.next_run = job._after(now)
+        if not job.running.acquire(blocking=False):
+            job.skipped += 1
+            log.info("Refresh scheduler: %s still running, skipping this run.", job.name)
+            return False
+        job.thread = threading.Thread(target=self._run, args=(job,), name=f"refresh-{job.name}")
+        job.thread.start()
+        return True
+
+    def _run(self, job):
+        started_at = datetime.now()
+        started = time.perf_counter()
+        record = {"started": started_at.isoformat(timespec="seconds")}
+        try:
+            record["result"] = repr(job.func())
+        except Exception as e:
+            job.failures += 1
+            record["error"] = str(e)
+            log.error("Refresh scheduler: %s failed: %s", job.name, e)
+        finally:
+            seconds = time.perf_counter() - started
+            record["seconds"] = round(seconds, 3)
+            job.runs += 1
+            job.seconds_total += seconds
+            job.seconds_max = max(job.seconds_max, seconds)
+            job.last = record
+            job.history.append(record)
+            job.running.release()
+        log.info("Refresh scheduler: %s finished in %.2fs", job.name, seconds)
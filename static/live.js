@@ -0,0 +1,11 @@
+// Reload the screen when the server reports an ingest that changed its data.
+// data-live-key: machine slug, "stores", "stores_goods_in", "utilization", or "*" for any change.
+(function () {
+  var key = document.currentScript.dataset.liveKey;
+  var socket = io();
+  socket.on("data_updated", function (event) {
+    if (key === "*" || event.changed.indexOf(key) !== -1) {
+      window.location.reload();
+    }
+  });
+})();
@@ -0,0 +1,174 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData, Table, and_, bindparam, inspect, text, types
+
+from bulk_load import bulk_load, load_rows
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_db(value):
+    """Convert a pandas/numpy scalar to a plain Python value the DB driver accepts"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _canonical(value):
+    """Normalize a value so rows read back from the DB compare equal to fresh DataFrame rows"""
+    value = _to_db(value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def _group_rows(rows, key_idx):
+    # Grouped on the canonical key so e.g. 1001 and 1001.0 match, but the raw
+    # key is kept for binding into the DELETE/UPDATE statements
+    groups = {}
+    for row in rows:
+        raw_key = tuple(row[i] for i in key_idx)
+        groups.setdefault(tuple(map(_canonical, raw_key)), (raw_key, []))[1].append(row)
+    return groups
+
+
+def _same_kind(reflected, wanted):
+    # DATETIME/TIMESTAMP, INTEGER/BIGINT, FLOAT/REAL/DOUBLE count as the same column type
+    for kind in (types.DateTime, types.Integer, types.Float, types.String):
+        if isinstance(wanted, kind):
+            return isinstance(reflected, kind)
+    return True
+
+
+def _null_pattern(key):
+    # "col = :k" can't match NULL keys, and "OR col IS NULL" would stop the
+    # planner using the key index, so each NULL pattern gets its own statement
+    return tuple(value is None for value in key)
+
+
+def _key_predicate(table, key_columns, pattern):
+    return and_(*(table.c[col].is_(None) if is_null else table.c[col] == bindparam(f"k{i}")
+                  for i, (col, is_null) in enumerate(zip(key_columns, pattern))))
+
+
+def _key_params(key):
+    return {f"k{i}": value for i, value in enumerate(key) if value is not None}
+
+
+def sync_table(conn, table, df, key_columns, track_column=None, dtype=None):
+    """
+    Bring `table` in line with `df` by inserting, updating and deleting only the rows that changed.
+    Rows are matched on `key_columns`; keys that appear more than once are replaced as a group.
+    Run it inside a transaction (engine.begin()) so readers never see a half-applied sync.
+    :param conn: SQLAlchemy connection (PostgreSQL or SQLite).
+    :param table: Table name.
+    :param df: New contents of the table.
+    :param key_columns: Columns identifying a row, e.g. ["worksordernumber", "resourcedescription"].
+    :param track_column: Optional column (e.g. "machine_key") whose values are reported for every
+                         inserted, updated or deleted row, under counts["changed"].
+    :param dtype: Optional {column: SQLAlchemy type} for the table's DDL; an existing table whose
+                  columns have other types is rebuilt, like one whose layout changed.
+    :return: {"inserted": n, "updated": n, "deleted": n, "unchanged": n[, "changed": set]}
+    """
+    columns = list(df.columns)
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    changed = set()
+    if track_column:
+        counts["changed"] = changed
+    inspector = inspect(conn)
+
+    existing_columns, retyped = None, False
+    if inspector.has_table(table):
+        reflected = inspector.get_columns(table)
+        existing_columns = [c["name"] for c in reflected]
+        retyped = any(not _same_kind(c["type"], dtype[c["name"]]) for c in reflected if c["name"] in (dtype or {}))
+
+    if existing_columns is None or sorted(existing_columns) != sorted(columns) or retyped:
+        # First load, or the sheet layout (or a column type) changed: rebuild, still inside the transaction
+        if existing_columns is not None:
+            counts["deleted"] = conn.execute(text(f"SELECT COUNT(*) FROM {_quote(table)}")).scalar()
+            if track_column in existing_columns:
+                changed.update(conn.execute(text(f"SELECT DISTINCT {_quote(track_column)} FROM {_quote(table)}")).scalars())
+            conn.execute(text(f"DROP TABLE {_quote(table)}"))
+        counts["inserted"] = bulk_load(conn, table, df, dtype=dtype)
+        if track_column:
+            changed.update(_to_db(v) for v in df[track_column].unique())
+        _create_key_index(conn, table, key_columns)
+        return counts
+
+    _create_key_index(conn, table, key_columns)
+    # Reflected so the dialect's type processing (e.g. SQLite DATETIME text)
+    # is applied the same way on read and write
+    db_table = Table(table, MetaData(), autoload_with=conn)
+    key_idx = [columns.index(c) for c in key_columns]
+
+    new_rows = [tuple(_to_db(v) for v in row) for row in df.itertuples(index=False, name=None)]
+    old_rows = [tuple(_to_db(v) for v in row)
+                for row in conn.execute(db_table.select().with_only_columns(*(db_table.c[c] for c in columns)))]
+
+    new_groups = _group_rows(new_rows, key_idx)
+    old_groups = _group_rows(old_rows, key_idx)
+
+    inserts, updates, deletes = [], {}, {}
+    for canon_key, (key, rows) in new_groups.items():
+        old = old_groups.get(canon_key, (None, None))[1]
+        if old is None:
+            inserts.extend(rows)
+            counts["inserted"] += len(rows)
+            continue
+        new_canon = sorted((tuple(map(_canonical, r)) for r in rows), key=repr)
+        old_canon = sorted((tuple(map(_canonical, r)) for r in old), key=repr)
+        if new_canon == old_canon:
+            counts["unchanged"] += len(rows)
+        elif len(rows) == 1 and len(old) == 1:
+            updates.setdefault(_null_pattern(key), []).append((key, rows[0]))
+            counts["updated"] += 1
+        else:
+            deletes.setdefault(_null_pattern(key), []).append(key)
+            inserts.extend(rows)
+            counts["updated"] += min(len(rows), len(old))
+            counts["inserted"] += max(len(rows) - len(old), 0)
+            counts["deleted"] += max(len(old) - len(rows), 0)
+
+    for canon_key, (key, old) in old_groups.items():
+        if canon_key not in new_groups:
+            deletes.setdefault(_null_pattern(key), []).append(key)
+            counts["deleted"] += len(old)
+
+    if track_column:
+        track_idx = columns.index(track_column)
+        changed.update(row[track_idx] for row in inserts)
+        changed.update(row[track_idx] for _, row in sum(updates.values(), []))
+        for key in sum(deletes.values(), []) + [key for key, _ in sum(updates.values(), [])]:
+            changed.update(row[track_idx] for row in old_groups[tuple(map(_canonical, key))][1])
+
+    for pattern, keys in deletes.items():
+        conn.execute(db_table.delete().where(_key_predicate(db_table, key_columns, pattern)),
+                     [_key_params(key) for key in keys])
+
+    values = {c: bindparam(f"v{i}") for i, c in enumerate(columns)}
+    for pattern, rows in updates.items():
+        conn.execute(db_table.update().where(_key_predicate(db_table, key_columns, pattern)).values(values),
+                     [{**_key_params(key), **{f"v{i}": v for i, v in enumerate(row)}} for key, row in rows])
+
+    load_rows(conn, table, columns, inserts)
+
+    return counts
+
+
+def _create_key_index(conn, table, key_columns):
+    index_name = f"ix_{table}_sync_key"
+    cols = ", ".join(_quote(c) for c in key_columns)
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(table)} ({cols})"))
@@ -0,0 +1,45 @@
+"""
+The per-row implementations the vectorized code replaced, kept as oracles for the equivalence
+tests (and as the "before" side of benchmark.py's timings).
+"""
+from datetime import datetime
+
+import pandas as pd
+
+
+def format_week_apply(val):
+    # The per-row BookingWeek parser update_machine_utilization used before normalize_booking_weeks
+    try:
+        if pd.isna(val):
+            return None
+        val_str = str(val).strip()
+        if val_str.isdigit() or ('.' in val_str and val_str.replace('.', '', 1).isdigit()):
+            return f"Week {int(float(val_str))}"
+        dt = pd.to_datetime(val, errors='coerce')
+        if not pd.isna(dt):
+            return f"Week {dt.isocalendar().week}"
+        return None
+    except:
+        return None
+
+
+def work_orders_iterrows(df, date_col="startdate", date_key="start_date"):
+    # The per-row loop get_dashboard_data/get_stores_data used before summarize_work_orders
+    today = datetime.today().date()
+    total_work_orders = df.shape[0]
+    total_today = df[df[date_col].dt.date == today].shape[0]
+    work_orders = []
+    for _, row in df.iterrows():
+        start_date = row[date_col].date() if pd.notnull(row[date_col]) else None
+        work_orders.append({
+            date_key: row[date_col].strftime("%d-%m-%y") if pd.notnull(row[date_col]) else "",
+            "work_order_number": row["worksordernumber"],
+            "part_number": row["partnumber"],
+            "total_hours_required": row["totalhours"],
+            "parts_qty": row["partsqty"],
+            "wo_status": row["wo status"],
+            "printing_status": row.get("printing status", "Not Printed"),
+            "is_backlog": start_date != today
+        })
+    return {"total_work_orders": total_work_orders, "total_today": total_today,
+            "total_backlog": total_work_orders - total_today, "work_orders": work_orders}
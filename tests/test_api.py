@@ -0,0 +1,97 @@
+import base64
+
+import pytest
+
+from benchmark import make_plan_workbook, make_utilization_workbook, offline_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """main on a fresh SQLite DB behind a fake Graph, with 50 work orders per plan block loaded"""
+    main, graph = offline_app(str(tmp_path / "app.db"), make_plan_workbook(50), make_utilization_workbook(50))
+    assert main.create_db_and_load_excel()
+    yield main, graph
+    main.get_engine().dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app[0].app.test_client()
+
+
+def cursor(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def test_cursor_pages_cover_every_record_once(client):
+    seen, url = [], "/api/v1/stores?limit=20"
+    while url:
+        body = client.get(url).get_json()
+        assert body["matched"] == 50 and body["total_work_orders"] == 50
+        seen += [item["work_order_number"] for item in body["items"]]
+        url = body["next_cursor"] and f"/api/v1/stores?limit=20&cursor={body['next_cursor']}"
+    assert len(seen) == 50 and len(set(seen)) == 50
+
+
+def test_limit_is_capped(app, client, monkeypatch):
+    monkeypatch.setattr(app[0], "api_max_limit", 7)
+    assert client.get("/api/v1/stores?limit=500").get_json()["count"] == 7
+    assert client.get("/api/v1/stores").get_json()["count"] == 7
+
+
+def test_filters_and_fields(client):
+    body = client.get("/api/v1/stores?from=2025-01-01&to=2025-01-10&status=released,allocated"
+                      "&fields=work_order_number,wo_status").get_json()
+    # Days 0-9 of the fixture's 60-day cycle, two status values out of three
+    assert body["matched"] == 7
+    assert all(set(item) == {"work_order_number", "wo_status"} for item in body["items"])
+    assert {item["wo_status"] for item in body["items"]} == {"Released", "Allocated"}
+
+
+def test_machine_page_carries_the_summary(client):
+    body = client.get("/api/v1/machines/grimme-1?limit=3").get_json()
+    assert body["count"] == 3 and body["matched"] == 10
+    assert body["schedule"]["weekly_hours"] == 80.0
+    assert client.get("/api/v1/machines/nope").status_code == 404
+
+
+def test_etag_304_until_the_data_changes(app, client):
+    main, graph = app
+    first = client.get("/api/v1/stores?limit=5")
+    etag = first.headers["ETag"]
+    assert client.get("/api/v1/stores?limit=5", headers={"If-None-Match": etag}).status_code == 304
+    # The ETag covers the query string too
+    assert client.get("/api/v1/stores?limit=6", headers={"If-None-Match": etag}).status_code == 200
+
+    graph.publish(main.file_url_pvt, make_plan_workbook(55))
+    assert main.create_db_and_load_excel()
+    refreshed = client.get("/api/v1/stores?limit=5", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200 and refreshed.headers["ETag"] != etag
+
+
+def test_cursor_expires_when_the_data_changes(app, client):
+    main, graph = app
+    next_cursor = client.get("/api/v1/stores?limit=5").get_json()["next_cursor"]
+    graph.publish(main.file_url_pvt, make_plan_workbook(55))
+    assert main.create_db_and_load_excel()
+    assert client.get(f"/api/v1/stores?limit=5&cursor={next_cursor}").status_code == 410
+
+
+@pytest.mark.parametrize("query, error", [
+    ("limit=abc", "'limit' must be a whole number of at least 1"),
+    ("limit=1.5", "'limit' must be a whole number of at least 1"),
+    ("limit=0", "'limit' must be a whole number of at least 1"),
+    ("limit=-3", "'limit' must be a whole number of at least 1"),
+    ("cursor=!!!", "Invalid cursor"),                    # not base64
+    (f"cursor={cursor('no-colon')}", "Invalid cursor"),  # wrong shape
+    (f"cursor={cursor('v:abc')}", "Invalid cursor"),     # non-numeric offset
+    (f"cursor={cursor('v:-5')}", "Invalid cursor"),
+    ("cursor=_w==", "Invalid cursor"),                   # not UTF-8
+    ("from=2025-13-01", "'from' must be YYYY-MM-DD"),
+    ("to=yesterday", "'to' must be YYYY-MM-DD"),
+    ("fields=nope", "Unknown fields: nope"),
+])
+def test_bad_query_is_400_with_a_fixed_message(client, query, error):
+    response = client.get(f"/api/v1/stores?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from benchmark import make_booking_weeks
+from main import normalize_booking_weeks
+from tests.legacy import format_week_apply
+
+
+def is_week_number(value):
+    text_value = str(value).strip()
+    return text_value.isdigit() or ('.' in text_value and text_value.replace('.', '', 1).isdigit())
+
+
+def test_normalize_booking_weeks_matches_format_week(trials=200, rows=50):
+    """Property test: on random cell mixes, normalize_booking_weeks agrees with the old parser"""
+    for seed in range(trials):
+        values = make_booking_weeks(rows, seed)
+        weeks = normalize_booking_weeks(values)
+        for value, (year, week, label) in zip(values, weeks.itertuples(index=False, name=None)):
+            old = format_week_apply(value)
+            # Same week as before...
+            assert old == (None if pd.isna(week) else f"Week {week}"), (seed, value, old, week)
+            # ...plus the ISO year for anything that was a date
+            if old is None:
+                assert label is None, (seed, value, label)
+            elif is_week_number(value):
+                assert pd.isna(year) and label == old, (seed, value, year, label)
+            else:
+                assert year == pd.Timestamp(value).isocalendar().year, (seed, value, year)
+                assert label == f"{old} ({year})", (seed, value, label)
@@ -0,0 +1,55 @@
+import pytest
+
+from benchmark import make_plan_workbook, make_utilization_workbook, offline_app
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """The app with the plan loaded, then a one-connection pool that gives up after a second"""
+    main, _ = offline_app(str(tmp_path / "app.db"), make_plan_workbook(20), make_utilization_workbook(20))
+    assert main.create_db_and_load_excel()
+    main.get_engine().dispose()
+    monkeypatch.setattr(main, "db_pool_size", 1)
+    monkeypatch.setattr(main, "db_max_overflow", 0)
+    monkeypatch.setattr(main, "db_pool_timeout", 1)
+    main._engine = None
+    yield main
+    main.get_engine().dispose()
+
+
+def test_in_memory_sqlite_engine(main, monkeypatch):
+    monkeypatch.setattr(main, "bank", "sqlite://")
+    main._engine = None
+    checkouts = main.pool_stats()["checkouts"]
+    conn = main.get_db_connection()
+    try:
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+    finally:
+        conn.close()
+    assert main.pool_stats()["checkouts"] == checkouts + 1
+
+
+def test_failed_reads_return_their_connection(main, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("read failed")
+
+    monkeypatch.setattr(main, "read_plan_table", broken)
+    for _ in range(3):
+        assert main.get_stores_data.uncached() is None
+        assert main.get_stores_goods_in_data.uncached() is None
+        with pytest.raises(RuntimeError):
+            main.get_dashboard_data.uncached("Grimme 1", "trimming")
+        with pytest.raises(RuntimeError):
+            main.get_complete_data.uncached()
+    assert main.get_engine().pool.checkedout() == 0
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_abandoned_export_returns_its_connection(main, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    response = main.app.test_client().get(f"/export/vacuum.{fmt}", buffered=False)
+    next(iter(response.response))  # the client reads the first chunk, then goes away
+    assert main.get_engine().pool.checkedout() == 1
+    response.close()
+    assert main.get_engine().pool.checkedout() == 0
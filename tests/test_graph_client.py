@@ -0,0 +1,141 @@
+from urllib.parse import quote
+
+import pytest
+import requests
+
+import graph_client
+from benchmark import FakeGraphSession
+from graph_client import GraphClient
+
+PATH = "Quality/Plan vs Actual.xlsx"
+BY_PATH = f"drives/drive/root:/{quote(PATH)}"
+
+
+class Clock:
+    """Stands in for graph_client's `time` module: sleeps advance the clock instead of waiting"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ScriptedSession(FakeGraphSession):
+    """FakeGraphSession that first answers with the queued (status, headers) responses"""
+
+    def __init__(self):
+        super().__init__()
+        self.script = []
+        self.requests = []
+
+    def request(self, method, url, headers=None, params=None, **kwargs):
+        self.requests.append((url.split("/v1.0/", 1)[-1], headers["Authorization"]))
+        if self.script:
+            status, response_headers = self.script.pop(0)
+            response = self._response(status, {})
+            response.headers.update(response_headers)
+            return response
+        return super().request(method, url, headers=headers, params=params, **kwargs)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(graph_client, "time", clock)
+    monkeypatch.setattr(graph_client.random, "uniform", lambda low, high: 0)
+    return clock
+
+
+@pytest.fixture
+def session():
+    session = ScriptedSession()
+    session.publish(PATH, b"v1")
+    return session
+
+
+@pytest.fixture
+def tokens():
+    return []
+
+
+@pytest.fixture
+def client(session, clock, tokens):
+    def acquire_token():
+        tokens.append(f"token-{len(tokens) + 1}")
+        return {"access_token": tokens[-1], "expires_in": 3600}
+    return GraphClient(acquire_token, item_ttl=300, max_retries=4, backoff=1.0, session=session)
+
+
+def test_throttled_request_honours_retry_after(client, session, clock):
+    session.script = [(429, {"Retry-After": "7"}), (503, {"Retry-After": "2"})]
+    assert client.item("drive", PATH)["id"] == "item-1"
+    assert clock.sleeps == [7, 2]
+
+
+def test_throttled_request_backs_off_exponentially(client, session, clock):
+    session.script = [(503, {})] * 3
+    assert client.item("drive", PATH)["id"] == "item-1"
+    assert clock.sleeps == [1.0, 2.0, 4.0]
+
+
+def test_retries_give_up_after_max_retries(client, session, clock):
+    session.script = [(429, {})] * 5
+    with pytest.raises(requests.HTTPError):
+        client.item("drive", PATH)
+    assert clock.sleeps == [1.0, 2.0, 4.0, 8.0]
+    assert len(session.requests) == 5
+
+
+def test_token_reused_until_it_nears_expiry(client, session, clock, tokens):
+    client.item("drive", PATH)
+    client.download("drive", PATH)
+    assert tokens == ["token-1"]
+    clock.now += 3600 - 30  # inside the one-minute renewal margin
+    client.download("drive", PATH)
+    assert tokens == ["token-1", "token-2"]
+
+
+def test_401_refreshes_the_token_once(client, session, tokens):
+    session.script = [(401, {})]
+    assert client.download("drive", PATH) == b"v1"
+    assert tokens == ["token-1", "token-2"]
+    assert [auth for _, auth in session.requests[:2]] == ["Bearer token-1", "Bearer token-2"]
+
+    session.script = [(401, {}), (401, {})]
+    with pytest.raises(requests.HTTPError):
+        client.item("drive", PATH)
+
+
+def test_item_id_cached_until_ttl(client, session, clock):
+    assert client.download("drive", PATH) == b"v1"
+    assert client.download("drive", PATH) == b"v1"
+    paths = [path for path, _ in session.requests]
+    assert paths.count(BY_PATH) == 1
+
+    clock.now += 301
+    session.requests.clear()
+    client.download("drive", PATH)
+    assert [path for path, _ in session.requests] == [
+        BY_PATH, "drives/drive/items/item-1/content"]
+
+
+def test_stale_item_id_falls_back_to_path(client, session):
+    assert client.item("drive", PATH)["id"] == "item-1"
+    # The file was replaced: same path, new item id
+    session.files[PATH]["id"] = "item-2"
+    session.files[PATH]["content"] = b"v2"
+
+    session.requests.clear()
+    assert client.item("drive", PATH)["id"] == "item-2"
+    assert [path for path, _ in session.requests] == ["drives/drive/items/item-1", BY_PATH]
+    assert client.download("drive", PATH) == b"v2"
+
+    session.files[PATH]["id"] = "item-3"
+    session.files[PATH]["content"] = b"v3"
+    assert client.download("drive", PATH) == b"v3"
@@ -0,0 +1,147 @@
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, select
+
+from benchmark import make_plan_workbook, make_utilization_workbook, offline_app
+from plan_history import compact_history, ingest_runs, plan_history, record_snapshot, run_as_of, snapshot_frame
+
+NOW = datetime(2025, 6, 30, 12, 0)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    yield engine
+    engine.dispose()
+
+
+def frame(*hours, machine_key="grimme-1"):
+    """One row per work order WO0, WO1, ... with the given totalhours"""
+    return pd.DataFrame({"worksordernumber": [f"WO{i}" for i in range(len(hours))], "totalhours": list(hours),
+                         "machine_key": machine_key})
+
+
+def record(engine, df, started_at):
+    with engine.begin() as conn:
+        return record_snapshot(conn, {"trimming_data": df}, started_at=started_at)
+
+
+def contents(engine, run_id, machine_key=None):
+    with engine.connect() as conn:
+        df = snapshot_frame(conn, "trimming_data", run_id, machine_key)
+    return sorted(df.itertuples(index=False, name=None)) if not df.empty else []
+
+
+def rows(df):
+    return sorted(df.itertuples(index=False, name=None))
+
+
+def test_reads_at_a_past_timestamp(engine):
+    first, second, third = frame(1.0, 2.0), frame(1.0, 5.0, 3.0), frame(5.0)
+    run1, changed1 = record(engine, first, datetime(2025, 3, 1, 8))
+    run2, changed2 = record(engine, second, datetime(2025, 3, 2, 8))
+    run3, changed3 = record(engine, third, datetime(2025, 3, 3, 8))
+    assert (changed1, changed2, changed3) == ({"trimming_data": 2}, {"trimming_data": 2}, {"trimming_data": 3})
+
+    with engine.connect() as conn:
+        assert run_as_of(conn, datetime(2025, 3, 1, 7, 59)) is None  # before the first run
+        assert run_as_of(conn, datetime(2025, 3, 1, 8)) == run1
+        assert run_as_of(conn, datetime(2025, 3, 2, 23, 59)) == run2
+        assert run_as_of(conn, datetime(2030, 1, 1)) == run3
+        assert run_as_of(conn, datetime(2030, 1, 1), source="utilization") is None
+
+    assert contents(engine, run1) == rows(first)
+    assert contents(engine, run2) == rows(second)
+    assert contents(engine, run3) == rows(third)
+
+
+def test_run_as_of_without_history(engine):
+    with engine.connect() as conn:
+        assert run_as_of(conn, NOW) is None
+
+
+def test_unchanged_run_writes_no_versions(engine):
+    record(engine, frame(1.0, 2.0), datetime(2025, 3, 1))
+    run2, changed = record(engine, frame(1.0, 2.0), datetime(2025, 3, 2))
+    assert changed == {"trimming_data": 0}
+    assert contents(engine, run2) == rows(frame(1.0, 2.0))
+    with engine.connect() as conn:
+        assert len(conn.execute(select(plan_history.c.id)).all()) == 2
+
+
+def test_machine_filter(engine):
+    df = pd.concat([frame(1.0, machine_key="grimme-1"), frame(2.0, 3.0, machine_key="grimme-2")])
+    run_id, _ = record(engine, df, datetime(2025, 3, 1))
+    assert contents(engine, run_id, "grimme-2") == rows(frame(2.0, 3.0, machine_key="grimme-2"))
+
+
+def test_compaction_keeps_the_right_snapshots(engine):
+    runs = {}
+    # Two runs a day for ten days; hours change every run so each has its own versions
+    for day in range(10):
+        for hour in (6, 10):
+            started_at = datetime.combine((NOW - timedelta(days=day)).date(), time(hour))
+            runs[started_at], _ = record(engine, frame(float(day * 100 + hour), 1.0), started_at)
+    # And one run far past the retention window
+    ancient = NOW - timedelta(days=400)
+    runs[ancient], _ = record(engine, frame(7.0, 7.0, 7.0), ancient)
+    before = {run_id: contents(engine, run_id) for run_id in runs.values()}
+
+    with engine.begin() as conn:
+        result = compact_history(conn, retention_days=9, daily_after_days=3, now=NOW)
+
+    with engine.connect() as conn:
+        kept = set(conn.execute(select(ingest_runs.c.run_id)).scalars())
+    cutoff_daily, cutoff_retention = NOW - timedelta(days=3), NOW - timedelta(days=9)
+    expected = {run_id for started_at, run_id in runs.items()
+                if started_at >= cutoff_daily or (started_at >= cutoff_retention and started_at.hour == 10)}
+    assert kept == expected
+    assert result["runs_deleted"] == len(runs) - len(expected)
+    assert result["versions_deleted"] > 0
+    # Every remaining run still reads back exactly as before
+    for run_id in kept:
+        assert contents(engine, run_id) == before[run_id]
+
+
+def test_compaction_always_keeps_the_latest_run(engine):
+    only, _ = record(engine, frame(1.0), NOW - timedelta(days=400))
+    with engine.begin() as conn:
+        assert compact_history(conn, retention_days=180, daily_after_days=7, now=NOW)["runs_deleted"] == 0
+    assert contents(engine, only) == rows(frame(1.0))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app with two plan loads, dated 1 and 2 March 2025 (50 then 55 work orders per block)"""
+    main, graph = offline_app(str(tmp_path / "app.db"), make_plan_workbook(50), make_utilization_workbook(50))
+    assert main.create_db_and_load_excel()
+    graph.publish(main.file_url_pvt, make_plan_workbook(55))
+    assert main.create_db_and_load_excel()
+    with main.get_engine().begin() as conn:
+        for run_id, day in ((1, 1), (2, 2)):
+            conn.execute(ingest_runs.update().where(ingest_runs.c.run_id == run_id)
+                         .values(started_at=datetime(2025, 3, day, 8)))
+    yield main
+    main.get_engine().dispose()
+
+
+@pytest.mark.parametrize("as_of, stores", [("2025-03-01", 50), ("2025-03-01T12:00", 50), ("2025-03-02", 55)])
+def test_as_of_pages_show_the_past(app, as_of, stores):
+    client = app.app.test_client()
+    assert client.get(f"/api/v1/stores?as_of={as_of}").get_json()["matched"] == stores
+    assert client.get(f"/stores?as_of={as_of}").status_code == 200
+    assert client.get(f"/api/v1/machines/grimme-1?as_of={as_of}").get_json()["matched"] == stores // 5
+    assert client.get("/api/v1/stores").get_json()["matched"] == 55
+
+
+def test_as_of_before_the_first_run_is_404(app):
+    client = app.app.test_client()
+    for url in ("/stores", "/stores_goods_in", "/grimme-1", "/complete", "/api/v1/stores",
+                "/api/v1/machines/grimme-1"):
+        assert client.get(f"{url}?as_of=2025-02-28").status_code == 404, url
+
+
+def test_bad_as_of_is_400(app):
+    assert app.app.test_client().get("/stores?as_of=yesterday").status_code == 400
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Any socket connect or engine creation while main imports fails the import
+IMPORT_MAIN = """
+import socket
+import sqlalchemy
+
+def refuse(*args, **kwargs):
+    raise AssertionError("network or DB access while importing main")
+
+socket.socket.connect = refuse
+sqlalchemy.create_engine = refuse
+
+import main
+assert main._engine is None, "engine created at import"
+assert main._msal_app is None and main._site_and_drive is None
+"""
+
+
+def test_import_main_makes_no_network_or_db_calls():
+    # A fresh interpreter, so nothing imported by other tests has already done the work
+    result = subprocess.run([sys.executable, "-c", IMPORT_MAIN], cwd=ROOT, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
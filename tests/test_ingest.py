@@ -0,0 +1,79 @@
+import pytest
+
+from benchmark import make_plan_workbook, make_utilization_workbook, offline_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """main on a fresh SQLite DB behind a fake Graph, with the plan loaded once (20 work orders per block)"""
+    main, graph = offline_app(str(tmp_path / "app.db"), make_plan_workbook(20), make_utilization_workbook(20))
+    assert main.create_db_and_load_excel()
+    yield main, graph
+    main.get_engine().dispose()
+
+
+def stores_rows(main):
+    with main.get_engine().connect() as conn:
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM stores_data").scalar()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_failed_parse_is_retried(app, monkeypatch, parallel):
+    main, graph = app
+    fetch, parse, write = main.ingest_sources["plan"]
+    graph.publish(main.file_url_pvt, make_plan_workbook(30))
+
+    def broken(content):
+        raise ValueError("transient parse error")
+
+    monkeypatch.setitem(main.ingest_sources, "plan", (fetch, broken, write))
+    report, _ = main.run_ingest(["plan"], parallel=parallel)
+    assert report["sources"]["plan"]["status"] == "error"
+    assert main.get_ingest_state("plan")["version"] == "c1"
+
+    monkeypatch.setitem(main.ingest_sources, "plan", (fetch, parse, write))
+    assert main.create_db_and_load_excel()
+    assert stores_rows(main) == 30
+    assert main.get_ingest_state("plan")["version"] == "c2"
+
+
+def test_unchanged_version_skips_the_download(app):
+    main, graph = app
+    calls = graph.calls
+    report, parsed = main.run_ingest(["plan"], parallel=False)
+    entry = report["sources"]["plan"]
+    assert entry["status"] == "unchanged" and entry["version"] == "c1"
+    assert "bytes" not in entry and parsed == {}
+    assert graph.calls - calls == 1  # the metadata request only
+
+
+def test_metadata_only_change_records_the_version(app):
+    main, graph = app
+    state = main.get_ingest_state("plan")
+    graph.publish(main.file_url_pvt, graph.files[main.file_url_pvt.strip("/")]["content"])  # saved, no edits
+
+    report, parsed = main.run_ingest(["plan"], parallel=False)
+    entry = report["sources"]["plan"]
+    assert entry["status"] == "unchanged" and entry["bytes"] > 0
+    assert parsed == {}
+    assert main.get_ingest_state("plan") == {"version": "c2", "content_hash": state["content_hash"]}
+    # Recorded, so the next run doesn't download it again
+    assert "bytes" not in main.run_ingest(["plan"], parallel=False)[0]["sources"]["plan"]
+
+
+def test_force_reloads_an_unchanged_workbook(app):
+    main, _ = app
+    report, parsed = main.run_ingest(["plan"], force=True, parallel=False)
+    entry = report["sources"]["plan"]
+    assert entry["status"] == "loaded" and set(parsed) == {"plan"}
+    assert entry["tables"]["stores_data"] == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 20}
+    assert stores_rows(main) == 20
+
+
+def test_sources_are_tracked_separately(app):
+    main, _ = app
+    assert main.get_ingest_state("utilization") is None
+    report, _ = main.run_ingest(parallel=False)
+    assert report["sources"]["plan"]["status"] == "unchanged"
+    assert report["sources"]["utilization"]["status"] == "loaded"
+    assert main.get_ingest_state("utilization")["version"] == "c1"
@@ -0,0 +1,45 @@
+import pytest
+
+from benchmark import make_plan_workbook, make_utilization_workbook, offline_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """main on a fresh SQLite DB behind a fake Graph, with the plan loaded once"""
+    main, graph = offline_app(str(tmp_path / "app.db"), make_plan_workbook(50), make_utilization_workbook(50))
+    assert main.create_db_and_load_excel()
+    yield main, graph
+    main.get_engine().dispose()
+
+
+def data_updates(client):
+    return [event["args"][0] for event in client.get_received() if event["name"] == "data_updated"]
+
+
+def test_edited_ingest_broadcasts_data_updated(app):
+    main, graph = app
+    client = main.socketio.test_client(main.app)
+    assert client.is_connected()
+
+    # Five more work orders in every block: one per machine, five per stores queue
+    graph.publish(main.file_url_pvt, make_plan_workbook(55))
+    assert main.create_db_and_load_excel()
+
+    [payload] = data_updates(client)
+    assert payload["changed"] == sorted(list(main.slug_to_excel_name) + ["stores", "stores_goods_in"])
+    assert payload["counts"]["yellow-cannon"] == 11
+    assert payload["counts"]["grimme-1"] == 11
+    assert payload["counts"]["stores"] == 55
+    assert payload["tables"]["vacuum_data"]["inserted"] == 5
+    assert payload["tables"]["stores_data"]["inserted"] == 5
+    assert payload["tables"]["trimming_data"]["unchanged"] == 50
+    assert payload["version"]
+    client.disconnect()
+
+
+def test_unchanged_ingest_broadcasts_nothing(app):
+    main, _ = app
+    client = main.socketio.test_client(main.app)
+    assert not main.create_db_and_load_excel()
+    assert data_updates(client) == []
+    client.disconnect()
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from metrics import MetricsRegistry
+
+
+def select_count(main):
+    return dict(((suffix, labels), value) for suffix, labels, value in main.query_seconds.samples()) \
+        .get(("_count", (("statement", "SELECT"),)), 0)
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    import main
+
+    if main._engine is not None:
+        main._engine.dispose()
+    monkeypatch.setattr(main, "bank", f"sqlite:///{tmp_path / 'metrics.db'}")
+    main._engine = None
+    yield main
+    main.get_engine().dispose()
+    main._engine = None
+
+
+def test_query_timing_survives_failed_statements(main):
+    with main.get_engine().connect() as conn:
+        before = select_count(main)
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM no_such_table")
+            conn.rollback()
+        assert select_count(main) == before
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+        assert select_count(main) == before + 1
+        assert not conn.info
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    runs = registry.counter("runs_total", "Runs")
+    runs.inc(source="plan")
+    runs.inc(2, source="plan")
+    seconds = registry.histogram("seconds", "Durations", buckets=(1, 5))
+    seconds.observe(0.5, stage="parse")
+    seconds.observe(3, stage="parse")
+    registry.gauge("age_seconds", "Age", lambda: [({"source": 'a"b'}, 1.5)])
+
+    assert registry.render().splitlines() == [
+        "# HELP runs_total Runs", "# TYPE runs_total counter", 'runs_total{source="plan"} 3',
+        "# HELP seconds Durations", "# TYPE seconds histogram",
+        'seconds_bucket{stage="parse",le="1.0"} 1', 'seconds_bucket{stage="parse",le="5.0"} 2',
+        'seconds_bucket{stage="parse",le="+Inf"} 2', 'seconds_sum{stage="parse"} 3.5', 'seconds_count{stage="parse"} 2',
+        "# HELP age_seconds Age", "# TYPE age_seconds gauge", 'age_seconds{source="a\\"b"} 1.5',
+    ]
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from capacity import daily_capacity, project_machine
+
+
+def simulate_machine(start_dates, hours, daily, start):
+    """Day-by-day reference for capacity.project_machine: (finish dates, capacity used when each order ends)"""
+    start = pd.Timestamp(start)
+    planned = [None if pd.isna(d) else (pd.Timestamp(d).normalize() - start).days for d in start_dates]
+    order = sorted(range(len(hours)), key=lambda i: (planned[i] is None, planned[i] or 0, i))
+    finish, used = [None] * len(hours), [None] * len(hours)
+    day, left, consumed = 0, daily[0], 0.0
+    for i in order:
+        release = max(planned[i] or 0, 0)
+        if day < release:
+            consumed += left + sum(daily[day + 1:release])
+            day, left = release, daily[release]
+        need = max(hours[i], 0)
+        while need > left + 1e-9 and day + 1 < len(daily):
+            need -= left
+            consumed += left
+            day += 1
+            left = daily[day]
+        if need > left + 1e-9:
+            break  # the rest never fit in the horizon
+        left -= need
+        consumed += need
+        finish[i], used[i] = start + timedelta(days=day), consumed
+    return finish, used
+
+
+def test_project_machine_matches_simulation(trials=200, orders=40, seed=0):
+    """Property test: project_machine agrees with a day-by-day simulation on random queues"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2025-01-08")
+    for _ in range(trials):
+        n = int(rng.integers(1, orders))
+        dates = start + pd.to_timedelta(rng.integers(-20, 60, n), unit="D")
+        dates = dates.where(rng.random(n) > 0.1)  # some orders have no start date
+        hours = np.round(rng.random(n) * 30, 2) * (rng.random(n) > 0.1)
+        weeks = pd.date_range("2024-12-30", periods=12, freq="W-MON")
+        weekly = pd.Series(rng.choice([0, 20, 40, 80], len(weeks)).astype(float), index=weeks)
+        weekly = weekly[rng.random(len(weeks)) > 0.3]
+        finish, overload = project_machine(dates.to_numpy(), hours, weekly, start, 40.0)
+        daily = daily_capacity(weekly, start, 366 * 20, 40.0)  # project_machine's longest horizon
+        expected, used = simulate_machine(list(dates), list(hours), daily, start)
+        for i in range(n):
+            assert (pd.Timestamp(finish[i]) if not pd.isna(finish[i]) else None) == expected[i], \
+                (i, finish[i], expected[i])
+            if expected[i] is None or pd.isna(dates[i]):
+                continue
+            planned = (dates[i] - start).days
+            available = daily[:planned + 1].sum() if planned >= 0 else 0.0
+            assert abs(overload[i] - max(used[i] - available, 0)) < 1e-6, (i, overload[i], used[i], available)
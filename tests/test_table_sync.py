@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, inspect, types
+
+from table_sync import sync_table
+
+KEY = ["worksordernumber", "resourcedescription"]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}")
+    yield engine
+    engine.dispose()
+
+
+def frame(*rows):
+    return pd.DataFrame(list(rows), columns=["worksordernumber", "resourcedescription", "startdate", "totalhours",
+                                             "machine_key"])
+
+
+def row(wo, machine="Grimme 1", day=1, hours=1.5, key="grimme-1"):
+    return [wo, machine, datetime(2025, 1, day), hours, key]
+
+
+def sync(engine, df, **kwargs):
+    with engine.begin() as conn:
+        return sync_table(conn, "trimming_data", df, KEY, track_column="machine_key", **kwargs)
+
+
+def expected_rows(df):
+    """Rows as sorted tuples, NULLs as None"""
+    return sorted(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None), key=repr)
+
+
+def table_rows(engine):
+    with engine.connect() as conn:
+        return expected_rows(pd.read_sql("SELECT * FROM trimming_data", conn, parse_dates=["startdate"]))
+
+
+def column_types(engine):
+    return {column["name"]: column["type"] for column in inspect(engine).get_columns("trimming_data")}
+
+
+def test_first_load_inserts_everything(engine):
+    df = frame(row("WO1"), row("WO2", "Grimme 2", key="grimme-2"))
+    assert sync(engine, df) == {"inserted": 2, "updated": 0, "deleted": 0, "unchanged": 0,
+                                "changed": {"grimme-1", "grimme-2"}}
+    assert table_rows(engine) == expected_rows(df)
+
+
+def test_inserts_updates_and_deletes_only_what_changed(engine):
+    sync(engine, frame(row("WO1"), row("WO2"), row("WO3", "Grimme 2", key="grimme-2")))
+    df = frame(row("WO1"), row("WO2", hours=4.0), row("WO4", "CMS EIDOS", key="cms-eidos"))
+
+    counts = sync(engine, df)
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1,
+                      "changed": {"grimme-1", "grimme-2", "cms-eidos"}}
+    assert table_rows(engine) == expected_rows(df)
+
+
+def test_unchanged_sync_changes_nothing(engine):
+    df = frame(row("WO1"), row("WO2"))
+    sync(engine, df)
+    assert sync(engine, df.copy()) == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 2, "changed": set()}
+
+
+def test_integer_and_float_values_compare_equal(engine):
+    df = frame(row("WO1", hours=2.0))
+    sync(engine, df)
+    df["totalhours"] = df["totalhours"].astype(int)
+    assert sync(engine, df)["unchanged"] == 1
+
+
+def test_duplicate_keys_are_replaced_as_a_group(engine):
+    sync(engine, frame(row("WO1", day=1), row("WO1", day=2), row("WO2")))
+
+    df = frame(row("WO1", day=1), row("WO1", day=3), row("WO1", day=4), row("WO2"))
+    counts = sync(engine, df)
+    assert counts["updated"] == 2 and counts["inserted"] == 1 and counts["unchanged"] == 1
+    assert table_rows(engine) == expected_rows(df)
+
+    df = frame(row("WO1", day=5), row("WO2"))
+    counts = sync(engine, df)
+    assert counts["updated"] == 1 and counts["deleted"] == 2
+    assert table_rows(engine) == expected_rows(df)
+
+
+def test_null_keys_match_null_keys(engine):
+    sync(engine, frame(row("WO1", machine=None), row(None, machine=None), row("WO2")))
+
+    df = frame(row("WO1", machine=None, hours=9.0), row(None, machine=None), row("WO2"))
+    counts = sync(engine, df)
+    assert counts["updated"] == 1 and counts["unchanged"] == 2 and counts["inserted"] == 0
+    assert table_rows(engine) == expected_rows(df)
+
+    df = frame(row("WO2"))
+    assert sync(engine, df)["deleted"] == 2
+    assert table_rows(engine) == expected_rows(df)
+
+
+def test_new_column_rebuilds_the_table(engine):
+    sync(engine, frame(row("WO1"), row("WO2")))
+    df = frame(row("WO1"), row("WO2"))
+    df["partsqty"] = [3, 4]
+
+    counts = sync(engine, df)
+    assert counts["inserted"] == 2 and counts["deleted"] == 2
+    assert table_rows(engine) == expected_rows(df)
+
+
+def test_column_type_change_rebuilds_the_table(engine):
+    df = frame(row("WO1"), row("WO2"))
+    sync(engine, df, dtype={"totalhours": types.Text()})
+    assert isinstance(column_types(engine)["totalhours"], types.Text)
+
+    counts = sync(engine, df, dtype={"totalhours": types.Float()})
+    assert counts["inserted"] == 2 and counts["deleted"] == 2
+    assert isinstance(column_types(engine)["totalhours"], types.Float)
+    assert table_rows(engine) == expected_rows(df)
+
+    # Same kind of type again (FLOAT vs REAL/DOUBLE): synced in place
+    assert sync(engine, df, dtype={"totalhours": types.Float()})["unchanged"] == 2
@@ -0,0 +1,15 @@
+import pytest
+
+from benchmark import make_work_order_frame
+from main import summarize_work_orders
+from tests.legacy import work_orders_iterrows
+
+
+@pytest.mark.parametrize("rows", [1, 17, 1_000])
+@pytest.mark.parametrize("printing_status", [True, False])
+def test_summarize_work_orders_matches_iterrows(rows, printing_status):
+    df = make_work_order_frame(rows)
+    if not printing_status:
+        df = df.drop(columns="printing status")  # machine tables have no printing status
+    # repr also catches type drift (numpy vs Python scalars) and NaN placement
+    assert repr(summarize_work_orders(df)) == repr(work_orders_iterrows(df))